@@ -0,0 +1,250 @@
+import os
+import re
+import time
+import logging
+from datetime import date, datetime, timedelta
+import pyodbc
+import pyarrow as pa
+import pyarrow.parquet as pq
+from db_pool import connection_string
+
+logger = logging.getLogger("archive")
+
+# ---------------------------------------------------------------------------
+# Archive Settings
+# ---------------------------------------------------------------------------
+# Cold tier root; one date=YYYY-MM-DD directory of Parquet files per UTC day
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+# Whole days older than this are moved out of SensorData
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+# Rows deleted (and written to one Parquet file) per transaction
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "50000"))
+# Pause between batches so ingestion is not starved of locks and log space
+ARCHIVE_BATCH_PAUSE = float(os.getenv("ARCHIVE_BATCH_PAUSE", "0.5"))
+# Seconds between a day becoming readable from the archive and its rows being
+# deleted from SensorData; readers that listed the archive just before still
+# find them there, as long as they finish within this time
+ARCHIVE_GRACE = float(os.getenv("ARCHIVE_GRACE", "60"))
+# Seconds between archive runs (0 = run once and exit)
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+SCHEMA = pa.schema([
+    ("ID", pa.int64()),
+    ("MachineID", pa.string()),
+    ("Timestamp", pa.timestamp("ms")),
+    ("Temperature", pa.float64()),
+    ("Pressure", pa.float64()),
+])
+
+PARTITION_NAME = re.compile(r"date=(\d{4}-\d{2}-\d{2})$")
+PART_NAME = re.compile(r"part-(\d+)-(\d+)\.parquet$")
+# Written once a day's rows are all in Parquet; holds the highest ID copied.
+# Only marked days are read, and only their parts up to that ID.
+MARKER_NAME = "_ARCHIVED"
+
+OLDEST_QUERY = "SELECT MIN(Timestamp) FROM SensorData"
+
+# A day is copied first and deleted after, bounded by the highest ID copied, so
+# late samples arriving meanwhile stay in SensorData for the next run. Rows a
+# writer has not committed yet block the copy under locking READ COMMITTED (the
+# SQL Server default), so none with a lower ID is deleted without being copied.
+COPY_QUERY = """
+    SELECT ID, MachineID, Timestamp, Temperature, Pressure
+    FROM SensorData
+    WHERE Timestamp >= ? AND Timestamp < ? AND ID > ?
+    ORDER BY ID
+"""
+
+DELETE_BATCH = """
+    DELETE TOP (?) FROM SensorData
+    WHERE Timestamp >= ? AND Timestamp < ? AND ID <= ?
+"""
+
+
+def partition_dir(day, root=ARCHIVE_DIR):
+    return os.path.join(root, f"date={day.isoformat()}")
+
+
+def archived_id(day, root=ARCHIVE_DIR):
+    """Highest ID archived for `day`, or None while the day has not been archived."""
+    try:
+        with open(os.path.join(partition_dir(day, root), MARKER_NAME)) as f:
+            return int(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def archived_days(start, end, root=ARCHIVE_DIR):
+    """
+    Days between start and end (inclusive) that are archived. Days are
+    archived oldest first, so they precede every day still in SensorData.
+    """
+    if not os.path.isdir(root):
+        return []
+    days = []
+    for name in os.listdir(root):
+        match = PARTITION_NAME.match(name)
+        if match:
+            day = date.fromisoformat(match.group(1))
+            if start.date() <= day <= end.date() and os.path.exists(os.path.join(root, name, MARKER_NAME)):
+                days.append(day)
+    return sorted(days)
+
+
+def part_files(day, root=ARCHIVE_DIR):
+    """The day's published parts up to its archived ID; later ones belong to an unfinished run."""
+    last_id = archived_id(day, root) or 0
+    directory = partition_dir(day, root)
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if PART_NAME.match(name) and int(PART_NAME.match(name).group(2)) <= last_id]
+
+
+def iter_archive(start, end, include_end=True, root=ARCHIVE_DIR):
+    """
+    Yield archived (ID, MachineID, Timestamp, Temperature, Pressure) rows with
+    start <= Timestamp <= end (< end if not include_end), newest first, in the
+    same shape as a SensorData row. Reads one day partition at a time.
+    """
+    filters = [("Timestamp", ">=", start), ("Timestamp", "<=" if include_end else "<", end)]
+    for day in reversed(archived_days(start, end, root)):
+        files = part_files(day, root)
+        if not files:
+            continue
+        table = pa.concat_tables([pq.read_table(path, filters=filters) for path in files])
+        table = table.sort_by([("Timestamp", "descending"), ("ID", "descending")])
+        yield from zip(*(table.column(name).to_pylist() for name in SCHEMA.names))
+
+
+def write_part(day, rows, root=ARCHIVE_DIR):
+    """
+    Write one batch to a hidden temporary file in the day's partition and
+    fsync it. `publish_part()` makes it visible once the whole day is copied.
+    """
+    directory = partition_dir(day, root)
+    os.makedirs(directory, exist_ok=True)
+    ids = [row[0] for row in rows]
+    path = os.path.join(directory, f".part-{min(ids):012d}-{max(ids):012d}.parquet.tmp")
+    # Sorted like the hot table's clustered index, so row groups prune well per machine
+    rows = sorted(rows, key=lambda row: (row[1], row[2]))
+    table = pa.Table.from_pydict(dict(zip(SCHEMA.names, map(list, zip(*rows)))), schema=SCHEMA)
+    pq.write_table(table, path, compression="zstd")
+    with open(path, "rb") as f:
+        os.fsync(f.fileno())
+    return path
+
+
+def publish_part(tmp_path):
+    directory, name = os.path.split(tmp_path)
+    final = os.path.join(directory, name[1:-len(".tmp")])
+    os.replace(tmp_path, final)
+    return final
+
+
+def mark_archived(day, last_id, root=ARCHIVE_DIR):
+    """Atomically record that every row of `day` up to `last_id` is in the day's parts."""
+    path = os.path.join(partition_dir(day, root), MARKER_NAME)
+    with open(path + ".tmp", "w") as f:
+        f.write(str(last_id))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def discard_unfinished(day, root=ARCHIVE_DIR):
+    """
+    Remove what an interrupted run left in the day's partition: hidden parts
+    and parts published past the marker. Their rows are still in SensorData.
+    """
+    directory = partition_dir(day, root)
+    if not os.path.isdir(directory):
+        return
+    last_id = archived_id(day, root) or 0
+    for name in os.listdir(directory):
+        hidden = name.startswith(".") and name.endswith(".tmp")
+        match = PART_NAME.match(name[1:-len(".tmp")] if hidden else name)
+        if match and (hidden or int(match.group(1)) > last_id):
+            os.remove(os.path.join(directory, name))
+            logger.warning(f"Dropped {name} of {day}, left over from an interrupted run")
+
+
+def archive_day(conn, day, batch_size=ARCHIVE_BATCH, root=ARCHIVE_DIR):
+    """
+    Move every SensorData row of `day` to Parquet; returns rows moved. The
+    rows are copied (one part per `batch_size` rows) and the day marked
+    archived before any is deleted, so at every point a reader finds each
+    row in exactly one tier: the archive for marked days, SensorData for
+    the rest. Rows of a day that was archived before (late samples, or a
+    run interrupted while deleting) are added to it the same way.
+    """
+    day_start = datetime.combine(day, datetime.min.time())
+    day_end = day_start + timedelta(days=1)
+    discard_unfinished(day, root)
+    last_id = archived_id(day, root) or 0
+
+    copied = 0
+    parts = []
+    cursor = conn.cursor()
+    cursor.execute(COPY_QUERY, day_start, day_end, last_id)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        parts.append(write_part(day, [tuple(row) for row in rows], root))
+        last_id = rows[-1][0]
+        copied += len(rows)
+    cursor.close()
+    conn.commit()
+    if parts:
+        for tmp_path in parts:
+            publish_part(tmp_path)
+        # Readers switch the whole day over to the archive here
+        mark_archived(day, last_id, root)
+        time.sleep(ARCHIVE_GRACE)
+
+    while True:
+        cursor = conn.cursor()
+        deleted = cursor.execute(DELETE_BATCH, batch_size, day_start, day_end, last_id).rowcount
+        cursor.close()
+        conn.commit()
+        if deleted < batch_size:
+            return copied
+        time.sleep(ARCHIVE_BATCH_PAUSE)
+
+
+def archive_old_days(conn, after_days=ARCHIVE_AFTER_DAYS, root=ARCHIVE_DIR):
+    """Archive whole days older than `after_days`, oldest first; returns rows moved."""
+    # Timestamps are OPC UA SourceTimestamps, i.e. UTC
+    cutoff = datetime.combine(datetime.utcnow().date() - timedelta(days=after_days), datetime.min.time())
+    moved = 0
+    while True:
+        cursor = conn.cursor()
+        oldest = cursor.execute(OLDEST_QUERY).fetchone()[0]
+        cursor.close()
+        conn.commit()
+        if oldest is None or oldest >= cutoff:
+            return moved
+        started = time.monotonic()
+        rows = archive_day(conn, oldest.date(), root=root)
+        logger.info(f"Archived {rows} rows of {oldest.date()} in {time.monotonic() - started:.1f}s")
+        moved += rows
+
+
+def main():
+    while True:
+        try:
+            conn = pyodbc.connect(connection_string(), autocommit=False)
+            try:
+                moved = archive_old_days(conn)
+                logger.info(f"Archive run done: {moved} rows moved to {ARCHIVE_DIR}")
+            finally:
+                conn.close()
+        except pyodbc.Error as e:
+            logger.error(f"Archive run failed: {e}")
+        if not ARCHIVE_INTERVAL:
+            return
+        time.sleep(ARCHIVE_INTERVAL)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
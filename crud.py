@@ -1,8 +1,15 @@
-from fastapi import FastAPI, HTTPException, Query, Security, Path
+from fastapi import FastAPI, HTTPException, Query, Security, Path, Request
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.security.api_key import APIKeyHeader
 from datetime import datetime, timedelta
+from array import array
+import threading
+import bisect
+import json
 import os
+import numpy as np
+from durable_store import DurableStore, EPOCH
 
 app = FastAPI(default_response_class=JSONResponse)
 
@@ -21,24 +28,443 @@ def get_api_key(x_api_key: str = Security(api_key_header), api_key: str = Query(
 # ------------------------------------------------------------------------------
 # In-Memory "Database" for Sensor Records
 # ------------------------------------------------------------------------------
-# We'll use a dictionary to simulate sensor records.
-# The key is an auto-incremented integer ID.
-records = {}
-next_id = 1
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# "dict" keeps one dict per record; "columnar" keeps typed column arrays (far less memory)
+RECORD_STORE = os.getenv("RECORD_STORE", "dict")
+# Upper bound on items accepted by one bulk create/update call
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "100000"))
+
+# Directory for the write-ahead log and snapshots; empty keeps the store in memory only
+RECORD_DATA_DIR = os.getenv("RECORD_DATA_DIR", "")
+# "group": a write returns once its WAL entry is fsynced (shared with concurrent writes);
+# "interval": fsync every RECORD_WAL_SYNC_INTERVAL seconds without waiting for it
+RECORD_WAL_SYNC = os.getenv("RECORD_WAL_SYNC", "group")
+RECORD_WAL_SYNC_INTERVAL = float(os.getenv("RECORD_WAL_SYNC_INTERVAL", "0.05"))
+RECORD_SNAPSHOT_INTERVAL = float(os.getenv("RECORD_SNAPSHOT_INTERVAL", "300"))
+# Skip a periodic snapshot unless at least this many WAL entries were written since the last
+RECORD_SNAPSHOT_MIN_ENTRIES = int(os.getenv("RECORD_SNAPSHOT_MIN_ENTRIES", "10000"))
+
+class RecordStore:
+    """
+    Sensor records keyed by an auto-incremented integer ID, plus time-ordered
+    indexes for range queries.
+
+    `records` maps ID -> record dict for O(1) lookups. `by_time` holds sorted
+    (Timestamp, ID) keys for the whole store and `by_machine` one such list per
+    MachineID, so a time range (optionally for one machine) is two binary
+    searches plus the matching keys: O(log n + k) instead of a full scan.
+    Any change to Timestamp or MachineID re-keys the record in both indexes.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.by_time = []
+        self.by_machine = {}
+        self.next_id = 1
+        # Endpoints run in a threadpool; mutations and index reads must not interleave
+        self.lock = threading.RLock()
+
+    def _index(self, rec):
+        key = (rec["Timestamp"], rec["ID"])
+        bisect.insort(self.by_time, key)
+        bisect.insort(self.by_machine.setdefault(rec["MachineID"], []), key)
+
+    def _unindex(self, rec):
+        key = (rec["Timestamp"], rec["ID"])
+        machine_keys = self.by_machine[rec["MachineID"]]
+        for keys in (self.by_time, machine_keys):
+            del keys[bisect.bisect_left(keys, key)]
+        if not machine_keys:
+            del self.by_machine[rec["MachineID"]]
+
+    def get(self, record_id):
+        return self.records.get(record_id)
+
+    def insert(self, machine_id, timestamp, temperature, pressure):
+        with self.lock:
+            rec = {
+                "ID": self.next_id,
+                "MachineID": machine_id,
+                "Timestamp": timestamp,
+                "Temperature": temperature,
+                "Pressure": pressure
+            }
+            self.records[rec["ID"]] = rec
+            self._index(rec)
+            self.next_id += 1
+            return rec
+
+    def update(self, record_id, **fields):
+        """Returns the updated record, or None if there is no such ID."""
+        with self.lock:
+            rec = self.records.get(record_id)
+            if rec is None:
+                return None
+            rekey = any(f in fields for f in ("Timestamp", "MachineID"))
+            if rekey:
+                self._unindex(rec)
+            rec.update(fields)
+            if rekey:
+                self._index(rec)
+            return rec
+
+    def delete(self, record_id):
+        """Returns whether the record existed."""
+        with self.lock:
+            rec = self.records.pop(record_id, None)
+            if rec is None:
+                return False
+            self._unindex(rec)
+            return True
+
+    def insert_many(self, rows):
+        """Insert (MachineID, Timestamp, Temperature, Pressure) tuples under one consecutive ID range."""
+        with self.lock:
+            first_id = self.next_id
+            self.next_id += len(rows)
+            for record_id, (machine_id, timestamp, temperature, pressure) in enumerate(rows, first_id):
+                self.records[record_id] = {
+                    "ID": record_id,
+                    "MachineID": machine_id,
+                    "Timestamp": timestamp,
+                    "Temperature": temperature,
+                    "Pressure": pressure
+                }
+                self.by_machine.setdefault(machine_id, []).append((timestamp, record_id))
+                self.by_time.append((timestamp, record_id))
+            # One sort per touched list instead of an insort per record; backfills are
+            # mostly in time order already, which Timsort handles in near-linear time
+            self.by_time.sort()
+            for machine_id in {row[0] for row in rows}:
+                self.by_machine[machine_id].sort()
+            return first_id, self.next_id - 1
+
+    def update_many(self, updates):
+        """Apply (ID, fields) pairs; returns the IDs that do not exist."""
+        with self.lock:
+            missing = []
+            for record_id, fields in updates:
+                if record_id in self.records:
+                    self.update(record_id, **fields)
+                else:
+                    missing.append(record_id)
+            return missing
+
+    def delete_range(self, start=None, end=None, machine_id=None):
+        """Delete every record in the time window (optionally for one machine); returns the count."""
+        with self.lock:
+            doomed = [record_id for _, record_id in self._keys_in_range(self.by_time if machine_id is None else self.by_machine.get(machine_id, []), start, end)]
+            machines = {self.records[record_id]["MachineID"] for record_id in doomed}
+            # The window is a contiguous slice of every time-ordered list it touches
+            for m in machines:
+                keys = self.by_machine[m]
+                lo, hi = self._bounds(keys, start, end)
+                del keys[lo:hi]
+                if not keys:
+                    del self.by_machine[m]
+            lo, hi = self._bounds(self.by_time, start, end)
+            if machine_id is None:
+                del self.by_time[lo:hi]
+            else:
+                # Other machines' keys share the window; only the window slice is filtered
+                gone = set(doomed)
+                self.by_time[lo:hi] = [key for key in self.by_time[lo:hi] if key[1] not in gone]
+            for record_id in doomed:
+                del self.records[record_id]
+            return len(doomed)
+
+    @staticmethod
+    def _bounds(keys, start, end):
+        lo = 0 if start is None else bisect.bisect_left(keys, (start,))
+        hi = len(keys) if end is None else bisect.bisect_right(keys, (end, float("inf")))
+        return lo, hi
+
+    def _keys_in_range(self, keys, start, end):
+        lo, hi = self._bounds(keys, start, end)
+        return keys[lo:hi]
+
+    def query(self, start=None, end=None, machine_id=None):
+        """Records with start <= Timestamp <= end (either bound optional), in time order."""
+        with self.lock:
+            keys = self.by_time if machine_id is None else self.by_machine.get(machine_id, [])
+            return [self.records[record_id] for _, record_id in self._keys_in_range(keys, start, end)]
+
+    def __contains__(self, record_id):
+        return record_id in self.records
+
+    def export_columns(self):
+        """Copy the records out as snapshot columns (see ColumnarRecordStore.COLUMNS), in ID order."""
+        with self.lock:
+            # IDs only ever grow, so dict insertion order is ID order
+            recs = list(self.records.values())
+            names = list(self.by_machine)
+            codes = {name: code for code, name in enumerate(names)}
+            n = len(recs)
+            return {
+                "ids": np.fromiter((r["ID"] for r in recs), dtype=np.int64, count=n),
+                "timestamps": np.fromiter(((r["Timestamp"] - EPOCH).total_seconds() for r in recs), dtype=np.float64, count=n),
+                "temperatures": np.fromiter((r["Temperature"] for r in recs), dtype=np.float64, count=n),
+                "pressures": np.fromiter((r["Pressure"] for r in recs), dtype=np.float64, count=n),
+                "machines": np.fromiter((codes[r["MachineID"]] for r in recs), dtype=np.int32, count=n),
+                "machine_names": names
+            }
+
+    def load_columns(self, next_id, columns):
+        """Replace the contents with snapshot columns."""
+        with self.lock:
+            ids = columns["ids"].tolist()
+            micros = np.round(columns["timestamps"] * 1e6).astype(np.int64)
+            timestamps = micros.astype("datetime64[us]").tolist()
+            names = columns["machine_names"]
+            machines = [names[code] for code in columns["machines"].tolist()]
+            self.records = {
+                record_id: {
+                    "ID": record_id,
+                    "MachineID": machine_id,
+                    "Timestamp": timestamp,
+                    "Temperature": temperature,
+                    "Pressure": pressure
+                }
+                for record_id, machine_id, timestamp, temperature, pressure in zip(
+                    ids, machines, timestamps, columns["temperatures"].tolist(), columns["pressures"].tolist())
+            }
+            self.by_time = sorted(zip(timestamps, ids))
+            self.by_machine = {}
+            for key in self.by_time:
+                self.by_machine.setdefault(self.records[key[1]]["MachineID"], []).append(key)
+            self.next_id = next_id
+
+class ColumnarRecordStore:
+    """
+    Array-backed alternative to RecordStore with the same interface.
+
+    Each field is a typed column (int64 ID, float64 epoch seconds, float64
+    temperature and pressure, int32 machine code) with MachineIDs interned in
+    a dictionary, about 37 bytes per record instead of a dict plus a datetime.
+    IDs are appended in increasing order, so an ID is found by binary search.
+    Deletes only clear the row's `alive` flag; once tombstones make up
+    `compact_ratio` of the rows the columns are rewritten without them.
+    Scans run over NumPy views of the columns, so filters and aggregations
+    are vectorized. Records are materialized as dicts only on the way out.
+    """
+
+    COLUMNS = (("ids", "q"), ("timestamps", "d"), ("temperatures", "d"), ("pressures", "d"), ("machines", "i"))
+
+    def __init__(self, compact_ratio=0.25):
+        self.compact_ratio = compact_ratio
+        self.ids = array("q")
+        self.timestamps = array("d")
+        self.temperatures = array("d")
+        self.pressures = array("d")
+        self.machines = array("i")
+        self.alive = bytearray()
+        self.machine_names = []
+        self.machine_codes = {}
+        self.dead = 0
+        self.next_id = 1
+        self.lock = threading.RLock()
+
+    def _intern(self, machine_id):
+        code = self.machine_codes.get(machine_id)
+        if code is None:
+            code = self.machine_codes[machine_id] = len(self.machine_names)
+            self.machine_names.append(machine_id)
+        return code
+
+    def _row(self, record_id):
+        row = bisect.bisect_left(self.ids, record_id)
+        if row < len(self.ids) and self.ids[row] == record_id and self.alive[row]:
+            return row
+        return None
+
+    def _record(self, row):
+        return {
+            "ID": self.ids[row],
+            "MachineID": self.machine_names[self.machines[row]],
+            "Timestamp": EPOCH + timedelta(seconds=self.timestamps[row]),
+            "Temperature": self.temperatures[row],
+            "Pressure": self.pressures[row]
+        }
+
+    def get(self, record_id):
+        with self.lock:
+            row = self._row(record_id)
+            return None if row is None else self._record(row)
+
+    def insert(self, machine_id, timestamp, temperature, pressure):
+        with self.lock:
+            self.ids.append(self.next_id)
+            self.timestamps.append((timestamp - EPOCH).total_seconds())
+            self.temperatures.append(temperature)
+            self.pressures.append(pressure)
+            self.machines.append(self._intern(machine_id))
+            self.alive.append(1)
+            self.next_id += 1
+            return self._record(len(self.ids) - 1)
+
+    def update(self, record_id, **fields):
+        """Returns the updated record, or None if there is no such ID."""
+        with self.lock:
+            row = self._row(record_id)
+            if row is None:
+                return None
+            if "MachineID" in fields:
+                self.machines[row] = self._intern(fields["MachineID"])
+            if "Timestamp" in fields:
+                self.timestamps[row] = (fields["Timestamp"] - EPOCH).total_seconds()
+            if "Temperature" in fields:
+                self.temperatures[row] = fields["Temperature"]
+            if "Pressure" in fields:
+                self.pressures[row] = fields["Pressure"]
+            return self._record(row)
+
+    def delete(self, record_id):
+        """Returns whether the record existed."""
+        with self.lock:
+            row = self._row(record_id)
+            if row is None:
+                return False
+            self.alive[row] = 0
+            self.dead += 1
+            if self.dead > self.compact_ratio * len(self.ids):
+                self.compact()
+            return True
+
+    def insert_many(self, rows):
+        """Insert (MachineID, Timestamp, Temperature, Pressure) tuples under one consecutive ID range."""
+        with self.lock:
+            first_id = self.next_id
+            self.next_id += len(rows)
+            self.ids.extend(range(first_id, self.next_id))
+            self.timestamps.extend((row[1] - EPOCH).total_seconds() for row in rows)
+            self.temperatures.extend(row[2] for row in rows)
+            self.pressures.extend(row[3] for row in rows)
+            self.machines.extend(self._intern(row[0]) for row in rows)
+            self.alive.extend(b"\x01" * len(rows))
+            return first_id, self.next_id - 1
+
+    def update_many(self, updates):
+        """Apply (ID, fields) pairs; returns the IDs that do not exist."""
+        with self.lock:
+            missing = []
+            for record_id, fields in updates:
+                if self._row(record_id) is None:
+                    missing.append(record_id)
+                else:
+                    self.update(record_id, **fields)
+            return missing
+
+    def delete_range(self, start=None, end=None, machine_id=None):
+        """Delete every record in the time window (optionally for one machine); returns the count."""
+        with self.lock:
+            rows = self.scan(start, end, machine_id)
+            np.frombuffer(self.alive, dtype=np.uint8)[rows] = 0
+            self.dead += len(rows)
+            if self.dead > self.compact_ratio * len(self.ids):
+                self.compact()
+            return len(rows)
+
+    def compact(self):
+        """Drop tombstoned rows from every column."""
+        with self.lock:
+            keep = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+            for name, typecode in self.COLUMNS:
+                column = np.frombuffer(getattr(self, name), dtype=typecode)
+                setattr(self, name, array(typecode, column[keep].tobytes()))
+            self.alive = bytearray(b"\x01" * len(self.ids))
+            self.dead = 0
+
+    def scan(self, start=None, end=None, machine_id=None):
+        """Row numbers of live records matching the filters, in (Timestamp, ID) order."""
+        with self.lock:
+            if not self.ids:
+                return np.array([], dtype=np.int64)
+            ts = np.frombuffer(self.timestamps, dtype=np.float64)
+            mask = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+            if start is not None:
+                mask &= ts >= (start - EPOCH).total_seconds()
+            if end is not None:
+                mask &= ts <= (end - EPOCH).total_seconds()
+            if machine_id is not None:
+                code = self.machine_codes.get(machine_id)
+                if code is None:
+                    return np.array([], dtype=np.int64)
+                mask &= np.frombuffer(self.machines, dtype=np.int32) == code
+            rows = np.flatnonzero(mask)
+            # Rows are in ID order, so a stable sort on time breaks ties by ID
+            return rows[np.argsort(ts[rows], kind="stable")]
+
+    def query(self, start=None, end=None, machine_id=None):
+        """Records with start <= Timestamp <= end (either bound optional), in time order."""
+        with self.lock:
+            return [self._record(row) for row in self.scan(start, end, machine_id).tolist()]
+
+    def __contains__(self, record_id):
+        with self.lock:
+            return self._row(record_id) is not None
+
+    def export_columns(self):
+        """Copies of the live rows of every column, plus the MachineID table."""
+        with self.lock:
+            keep = np.frombuffer(self.alive, dtype=np.uint8).astype(bool)
+            columns = {name: np.frombuffer(getattr(self, name), dtype=typecode)[keep] for name, typecode in self.COLUMNS}
+            columns["machine_names"] = list(self.machine_names)
+            return columns
+
+    def load_columns(self, next_id, columns):
+        """Replace the contents with snapshot columns; one memcpy per column."""
+        with self.lock:
+            for name, typecode in self.COLUMNS:
+                column = array(typecode)
+                column.frombytes(memoryview(columns[name]).cast("B"))
+                setattr(self, name, column)
+            self.alive = bytearray(b"\x01" * len(self.ids))
+            self.dead = 0
+            self.machine_names = list(columns["machine_names"])
+            self.machine_codes = {name: code for code, name in enumerate(self.machine_names)}
+            self.next_id = next_id
+
+store = ColumnarRecordStore() if RECORD_STORE == "columnar" else RecordStore()
+if RECORD_DATA_DIR:
+    # Recovers the previous contents from the latest snapshot plus the WAL tail
+    store = DurableStore(
+        store,
+        RECORD_DATA_DIR,
+        sync=RECORD_WAL_SYNC,
+        sync_interval=RECORD_WAL_SYNC_INTERVAL,
+        snapshot_interval=RECORD_SNAPSHOT_INTERVAL,
+        snapshot_min_entries=RECORD_SNAPSHOT_MIN_ENTRIES
+    )
+    store.open()
+
+@app.on_event("shutdown")
+def close_store():
+    if RECORD_DATA_DIR:
+        store.close()
 
 # Preload a couple of sample records.
 def preload_records():
-    global next_id
     sample = [
         {"MachineID": "Machine1", "Timestamp": datetime.now() - timedelta(hours=1), "Temperature": 23.5, "Pressure": 1015.2},
         {"MachineID": "Machine2", "Timestamp": datetime.now() - timedelta(hours=2), "Temperature": 25.1, "Pressure": 1012.8},
     ]
     for rec in sample:
-        rec["ID"] = next_id
-        records[next_id] = rec
-        next_id += 1
+        store.insert(rec["MachineID"], rec["Timestamp"], rec["Temperature"], rec["Pressure"])
+
+# Only on a fresh store; a recovered one keeps what it had.
+if store.next_id == 1:
+    preload_records()
+
+def parse_timestamp(value):
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM:SS")
 
-preload_records()
+def format_record(rec):
+    # Copy with a formatted timestamp; the stored record keeps its datetime.
+    return {**rec, "Timestamp": rec["Timestamp"].strftime(TIMESTAMP_FORMAT)}
 
 # ------------------------------------------------------------------------------
 # GET: Retrieve All Records (or those within a time range)
@@ -47,26 +473,125 @@ preload_records()
 def get_records(
     api_key: str = Security(get_api_key),
     start: str = Query(None, description="Start datetime in format YYYY-MM-DD HH:MM:SS"),
-    end: str = Query(None, description="End datetime in format YYYY-MM-DD HH:MM:SS")
+    end: str = Query(None, description="End datetime in format YYYY-MM-DD HH:MM:SS"),
+    machine: str = Query(None, description="Only return records for this MachineID")
 ):
-    # Get all records as a list.
-    result = list(records.values())
-    if start and end:
+    start_dt = parse_timestamp(start) if start else None
+    end_dt = parse_timestamp(end) if end else None
+    # Index lookup: binary search on the time-ordered keys, no full scan.
+    result = store.query(start_dt, end_dt, machine)
+    return {"status": "success", "data": [format_record(rec) for rec in result]}
+
+# ------------------------------------------------------------------------------
+# Bulk Operations
+# Bodies are a JSON array or NDJSON (Content-Type: application/x-ndjson), one
+# record object per item. Every item is validated first; the valid ones are then
+# applied in a single pass under the store lock and the invalid ones are reported
+# back by their position in the body. Declared before /records/{record_id} so
+# "bulk" is not taken for a record ID.
+# ------------------------------------------------------------------------------
+async def read_bulk_items(request: Request):
+    body = await request.body()
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid request body: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON array or NDJSON")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per request")
+    return items
+
+def validate_fields(item, required):
+    """Return the typed record fields of one bulk item; raises ValueError on bad input."""
+    if not isinstance(item, dict):
+        raise ValueError("Item must be an object")
+    missing = [name for name in required if item.get(name) is None]
+    if missing:
+        raise ValueError(f"Missing field(s): {', '.join(missing)}")
+    fields = {}
+    if item.get("MachineID") is not None:
+        if not isinstance(item["MachineID"], str):
+            raise ValueError("MachineID must be a string")
+        fields["MachineID"] = item["MachineID"]
+    if item.get("Timestamp") is not None:
         try:
-            start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
-            end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM:SS")
-        result = [rec for rec in result if start_dt <= rec["Timestamp"] <= end_dt]
-    # Build a new list with formatted timestamps.
-    formatted_result = []
-    for rec in result:
-        formatted_rec = rec.copy()
-        if isinstance(formatted_rec["Timestamp"], datetime):
-            formatted_rec["Timestamp"] = formatted_rec["Timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-        # If it's already a string, assume it's formatted.
-        formatted_result.append(formatted_rec)
-    return {"status": "success", "data": formatted_result}
+            fields["Timestamp"] = datetime.strptime(item["Timestamp"], TIMESTAMP_FORMAT)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid datetime format. Use YYYY-MM-DD HH:MM:SS")
+    for name in ("Temperature", "Pressure"):
+        if item.get(name) is not None:
+            if isinstance(item[name], bool) or not isinstance(item[name], (int, float)):
+                raise ValueError(f"{name} must be a number")
+            fields[name] = float(item[name])
+    return fields
+
+def bulk_result(applied, errors, **extra):
+    return {
+        "status": "success" if not errors else "partial" if applied else "failed",
+        **extra,
+        "errors": errors
+    }
+
+@app.post("/records/bulk", response_class=JSONResponse)
+async def create_records_bulk(request: Request, api_key: str = Security(get_api_key)):
+    """
+    Create many records. Valid items get consecutive IDs from first_id to
+    last_id in body order, skipping the items listed in errors.
+    """
+    rows, errors = [], []
+    for index, item in enumerate(await read_bulk_items(request)):
+        try:
+            fields = validate_fields(item, ("MachineID", "Timestamp", "Temperature", "Pressure"))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        rows.append((fields["MachineID"], fields["Timestamp"], fields["Temperature"], fields["Pressure"]))
+
+    if not rows:
+        return bulk_result(0, errors, created=0)
+    first_id, last_id = await run_in_threadpool(store.insert_many, rows)
+    return bulk_result(len(rows), errors, created=len(rows), first_id=first_id, last_id=last_id)
+
+@app.put("/records/bulk", response_class=JSONResponse)
+async def update_records_bulk(request: Request, api_key: str = Security(get_api_key)):
+    """Update many records; each item carries its ID plus the fields to change."""
+    updates, errors = [], []
+    for index, item in enumerate(await read_bulk_items(request)):
+        try:
+            fields = validate_fields(item, ("ID",))
+            if isinstance(item["ID"], bool) or not isinstance(item["ID"], int):
+                raise ValueError("ID must be an integer")
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+            continue
+        updates.append((index, item["ID"], fields))
+
+    missing = set(await run_in_threadpool(store.update_many, [(record_id, fields) for _, record_id, fields in updates]))
+    for index, record_id, _ in updates:
+        if record_id in missing:
+            errors.append({"index": index, "ID": record_id, "error": "Record not found"})
+    errors.sort(key=lambda error: error["index"])
+    updated = len(updates) - sum(1 for _, record_id, _ in updates if record_id in missing)
+    return bulk_result(updated, errors, updated=updated)
+
+@app.delete("/records", response_class=JSONResponse)
+def delete_records_range(
+    api_key: str = Security(get_api_key),
+    start: str = Query(None, description="Start datetime in format YYYY-MM-DD HH:MM:SS"),
+    end: str = Query(None, description="End datetime in format YYYY-MM-DD HH:MM:SS"),
+    machine: str = Query(None, description="Only delete records for this MachineID")
+):
+    if start is None and end is None and machine is None:
+        # Refuse to wipe the whole store by accident
+        raise HTTPException(status_code=400, detail="Give at least one of start, end or machine")
+    start_dt = parse_timestamp(start) if start else None
+    end_dt = parse_timestamp(end) if end else None
+    deleted = store.delete_range(start_dt, end_dt, machine)
+    return {"status": "success", "deleted": deleted}
 
 # ------------------------------------------------------------------------------
 # POST: Create a New Sensor Record
@@ -79,24 +604,8 @@ def create_record(
     Pressure: float,
     api_key: str = Security(get_api_key)
 ):
-    global next_id
-    try:
-        ts = datetime.strptime(Timestamp, "%Y-%m-%d %H:%M:%S")
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM:SS")
-    record = {
-        "ID": next_id,
-        "MachineID": MachineID,
-        "Timestamp": ts,
-        "Temperature": Temperature,
-        "Pressure": Pressure
-    }
-    records[next_id] = record
-    next_id += 1
-    # Prepare a copy with formatted timestamp.
-    formatted_record = record.copy()
-    formatted_record["Timestamp"] = formatted_record["Timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-    return {"status": "success", "record": formatted_record}
+    record = store.insert(MachineID, parse_timestamp(Timestamp), Temperature, Pressure)
+    return {"status": "success", "record": format_record(record)}
 
 # ------------------------------------------------------------------------------
 # PUT: Update an Existing Sensor Record
@@ -110,25 +619,22 @@ def update_record(
     Pressure: float = None,
     api_key: str = Security(get_api_key)
 ):
-    if record_id not in records:
-        raise HTTPException(status_code=404, detail="Record not found")
-    record = records[record_id]
+    # Validate everything before touching the record (and its index entries).
+    fields = {}
     if MachineID is not None:
-        record["MachineID"] = MachineID
+        fields["MachineID"] = MachineID
     if Timestamp is not None:
-        try:
-            record["Timestamp"] = datetime.strptime(Timestamp, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid datetime format. Use YYYY-MM-DD HH:MM:SS")
+        fields["Timestamp"] = parse_timestamp(Timestamp)
     if Temperature is not None:
-        record["Temperature"] = Temperature
+        fields["Temperature"] = Temperature
     if Pressure is not None:
-        record["Pressure"] = Pressure
-    # Prepare a copy with formatted timestamp.
-    formatted_record = record.copy()
-    if isinstance(formatted_record["Timestamp"], datetime):
-        formatted_record["Timestamp"] = formatted_record["Timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-    return {"status": "success", "record": formatted_record}
+        fields["Pressure"] = Pressure
+    # The store checks that the record exists under its lock, so a concurrent
+    # delete cannot slip in between the check and the update
+    record = store.update(record_id, **fields)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return {"status": "success", "record": format_record(record)}
 
 # ------------------------------------------------------------------------------
 # DELETE: Remove a Sensor Record
@@ -138,9 +644,8 @@ def delete_record(
     record_id: int = Path(..., description="ID of the sensor record"),
     api_key: str = Security(get_api_key)
 ):
-    if record_id not in records:
+    if not store.delete(record_id):
         raise HTTPException(status_code=404, detail="Record not found")
-    del records[record_id]
     return {"status": "success", "message": f"Record {record_id} deleted"}
 
 # ------------------------------------------------------------------------------
@@ -12,7 +12,7 @@ GO
 IF OBJECT_ID('dbo.SensorData', 'U') IS NULL
 BEGIN
     CREATE TABLE SensorData (
-        ID INT IDENTITY(1,1) PRIMARY KEY,
+        ID INT IDENTITY(1,1) PRIMARY KEY NONCLUSTERED,
         MachineID VARCHAR(50),
         Timestamp DATETIME,
         Temperature FLOAT,
@@ -20,3 +20,78 @@ BEGIN
     );
 END
 GO
+
+-- Store rows clustered by machine and time, so per-machine ranges are contiguous
+-- reads. Older databases have the clustered primary key on ID; move it off first.
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('dbo.SensorData') AND name = 'CIX_SensorData_Machine_Time')
+BEGIN
+    DECLARE @pk SYSNAME, @sql NVARCHAR(400);
+    SELECT @pk = name FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.SensorData') AND is_primary_key = 1 AND type = 1;
+    IF @pk IS NOT NULL
+    BEGIN
+        SET @sql = N'ALTER TABLE dbo.SensorData DROP CONSTRAINT ' + QUOTENAME(@pk);
+        EXEC sp_executesql @sql;
+        ALTER TABLE dbo.SensorData ADD PRIMARY KEY NONCLUSTERED (ID);
+    END
+    CREATE CLUSTERED INDEX CIX_SensorData_Machine_Time ON dbo.SensorData (MachineID, Timestamp);
+END
+GO
+
+-- Window queries across all machines (/sensors, rollup edges, the archive job's
+-- oldest-row lookup and batched deletes) seek on Timestamp
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID('dbo.SensorData') AND name = 'IX_SensorData_Timestamp')
+BEGIN
+    CREATE NONCLUSTERED INDEX IX_SensorData_Timestamp ON dbo.SensorData (Timestamp) INCLUDE (MachineID, Temperature, Pressure);
+END
+GO
+
+-- Per-minute min/max/sum/count per machine and tag, maintained by mqtt-client at ingest
+IF OBJECT_ID('dbo.SensorRollup1m', 'U') IS NULL
+BEGIN
+    CREATE TABLE SensorRollup1m (
+        MachineID VARCHAR(50) NOT NULL,
+        Tag VARCHAR(50) NOT NULL,
+        BucketStart DATETIME NOT NULL,
+        MinValue FLOAT,
+        MaxValue FLOAT,
+        SumValue FLOAT,
+        SampleCount INT,
+        PRIMARY KEY (BucketStart, MachineID, Tag)
+    );
+
+    -- Backfill from the rows stored before the rollup existed
+    INSERT INTO SensorRollup1m (MachineID, Tag, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+    SELECT MachineID, v.Tag, DATEADD(minute, DATEDIFF(minute, 0, Timestamp), 0),
+           MIN(v.Value), MAX(v.Value), SUM(v.Value), COUNT(*)
+    FROM SensorData
+    CROSS APPLY (VALUES ('Temperature', Temperature), ('Pressure', Pressure)) AS v (Tag, Value)
+    WHERE MachineID IS NOT NULL AND v.Value IS NOT NULL
+    GROUP BY MachineID, v.Tag, DATEADD(minute, DATEDIFF(minute, 0, Timestamp), 0);
+END
+GO
+
+-- Per-hour min/max/sum/count per machine and tag, maintained by mqtt-client at ingest
+IF OBJECT_ID('dbo.SensorRollup1h', 'U') IS NULL
+BEGIN
+    CREATE TABLE SensorRollup1h (
+        MachineID VARCHAR(50) NOT NULL,
+        Tag VARCHAR(50) NOT NULL,
+        BucketStart DATETIME NOT NULL,
+        MinValue FLOAT,
+        MaxValue FLOAT,
+        SumValue FLOAT,
+        SampleCount INT,
+        PRIMARY KEY (BucketStart, MachineID, Tag)
+    );
+
+    -- Backfill from the rows stored before the rollup existed
+    INSERT INTO SensorRollup1h (MachineID, Tag, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+    SELECT MachineID, v.Tag, DATEADD(hour, DATEDIFF(hour, 0, Timestamp), 0),
+           MIN(v.Value), MAX(v.Value), SUM(v.Value), COUNT(*)
+    FROM SensorData
+    CROSS APPLY (VALUES ('Temperature', Temperature), ('Pressure', Pressure)) AS v (Tag, Value)
+    WHERE MachineID IS NOT NULL AND v.Value IS NOT NULL
+    GROUP BY MachineID, v.Tag, DATEADD(hour, DATEDIFF(hour, 0, Timestamp), 0);
+END
+GO
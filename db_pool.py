@@ -0,0 +1,200 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import pyodbc
+
+logger = logging.getLogger("db_pool")
+
+# ---------------------------------------------------------------------------
+# Database Connection Settings (shared by satya.py and ws_server.py)
+# ---------------------------------------------------------------------------
+DB_SERVER = os.getenv("DB_SERVER", "localhost,1533")  # Include port if needed
+DB_DATABASE = os.getenv("DB_DATABASE", "SensorDB")
+DB_USERNAME = os.getenv("DB_USERNAME", "satya")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "Satya@3479")
+DB_DRIVER = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Seconds a caller may wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))
+
+def connection_string():
+    return (
+        f"DRIVER={{{DB_DRIVER}}};"
+        f"SERVER={DB_SERVER};"
+        f"DATABASE={DB_DATABASE};"
+        f"UID={DB_USERNAME};"
+        f"PWD={DB_PASSWORD};"
+    )
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of pyodbc connections.
+
+    Connections are created on demand up to `max_size` and reused LIFO, so
+    the hottest connection is handed out first. A connection that sat idle
+    for more than `check_after` seconds is pinged with SELECT 1 and replaced
+    if the ping fails. Time spent waiting for a connection is recorded and
+    reported by `stats()`.
+    """
+
+    def __init__(self, conn_str, min_size=1, max_size=10, timeout=30.0, check_after=30.0):
+        self.conn_str = conn_str
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+
+        self._idle = []  # (connection, last released at)
+        self._size = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._acquired = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._health_failures = 0
+
+    def open(self):
+        """Pre-open `min_size` connections; failures are logged and retried on demand."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = pyodbc.connect(self.conn_str)
+            except pyodbc.Error as e:
+                with self._cond:
+                    self._size -= 1
+                logger.warning(f"Could not pre-open pool connection: {e}")
+                return
+            self.release(conn)
+
+    def acquire(self, timeout=None):
+        started = time.monotonic()
+        deadline = started + (self.timeout if timeout is None else timeout)
+        conn = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {deadline - started:.1f}s")
+                self._cond.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = pyodbc.connect(self.conn_str)
+            elif time.monotonic() - released_at > self.check_after and not self._healthy(conn):
+                self._health_failures += 1
+                self._close_quietly(conn)
+                conn = pyodbc.connect(self.conn_str)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._cond:
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+                conn = None
+            self._cond.notify()
+        if conn is not None:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except pyodbc.Error:
+            # The connection may be broken; do not hand it to the next caller
+            self.release(conn, discard=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "acquired": self._acquired,
+                "avg_wait_ms": round(1000 * self._wait_total / self._acquired, 3) if self._acquired else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 3),
+                "timeouts": self._timeouts,
+                "health_check_failures": self._health_failures,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1").fetchone()
+            cursor.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+
+def create_pool():
+    return ConnectionPool(
+        connection_string(),
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX,
+        timeout=DB_POOL_TIMEOUT,
+        check_after=DB_POOL_CHECK_AFTER,
+    )
@@ -0,0 +1,82 @@
+import os
+import time
+import random
+import struct
+import datetime
+from payload import decode, encode_batch, encode_json
+
+# Benchmark of the payload formats: python bench_payload.py
+# Samples of this many machines, each with the two default tags at 1 Hz
+MACHINES = int(os.getenv("MACHINES", "100"))
+SAMPLES_PER_MACHINE = int(os.getenv("SAMPLES_PER_MACHINE", "200"))
+BATCH_SIZES = [int(n) for n in os.getenv("BATCH_SIZES", "1,10,50,200").split(",")]
+
+TAGS = [("temperature", "f"), ("pressure", "f")]
+# PUBLISH fixed header (2), topic length (2) and topic; what the broker handles per message
+TOPIC = "machine42/sensor"
+MQTT_OVERHEAD = 2 + 2 + len(TOPIC)
+
+
+def make_samples():
+    rng = random.Random(42)
+    start = datetime.datetime(2025, 3, 28, 5, 46, 57, 513000)
+    machines = []
+    for _ in range(MACHINES):
+        samples = []
+        for n in range(SAMPLES_PER_MACHINE):
+            # Float tags reach the gateway as float32 values
+            values = [float32(rng.uniform(20.0, 35.0)), float32(rng.uniform(995.0, 1025.0))]
+            samples.append((start + datetime.timedelta(seconds=n), *values))
+        machines.append(samples)
+    return machines
+
+
+def float32(value):
+    return struct.unpack("<f", struct.pack("<f", value))[0]
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def bench_json(machines):
+    names = ["timestamp"] + [name for name, _ in TAGS]
+    encode_s, payloads = timed(lambda: [encode_json(dict(zip(names, s))) for samples in machines for s in samples])
+    decode_s, _ = timed(lambda: [decode(p) for p in payloads])
+    return "json", payloads, encode_s, decode_s
+
+
+def bench_binary(machines, batch_size):
+    def encode_all():
+        return [
+            encode_batch(TAGS, samples[i:i + batch_size])
+            for samples in machines for i in range(0, len(samples), batch_size)
+        ]
+    encode_s, payloads = timed(encode_all)
+    decode_s, _ = timed(lambda: [decode(p) for p in payloads])
+    return f"binary x{batch_size}", payloads, encode_s, decode_s
+
+
+def main():
+    machines = make_samples()
+    total = MACHINES * SAMPLES_PER_MACHINE
+    results = [bench_json(machines)] + [bench_binary(machines, n) for n in BATCH_SIZES]
+    json_wire = None
+    print(f"{total} samples, {len(TAGS)} tags each\n")
+    print(f"{'format':<13}{'messages':>9}{'bytes/sample':>14}{'wire/sample':>13}"
+          f"{'encode us':>11}{'decode us':>11}{'wire saved':>12}")
+    for name, payloads, encode_s, decode_s in results:
+        payload_bytes = sum(len(p) for p in payloads)
+        wire = payload_bytes + MQTT_OVERHEAD * len(payloads)
+        json_wire = json_wire or wire
+        print(f"{name:<13}{len(payloads):>9}{payload_bytes / total:>14.1f}{wire / total:>13.1f}"
+              f"{1e6 * encode_s / total:>11.2f}{1e6 * decode_s / total:>11.2f}{1 - wire / json_wire:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import os
+import time
+import zlib
+import struct
+import logging
+import threading
+import collections
+
+logger = logging.getLogger("gateway.buffer")
+
+SEGMENT_NAME = "segment-{:012d}.buf"
+CURSOR_FILE = "cursor"
+
+# payload length, crc32 of topic + payload, enqueued at (epoch seconds), topic length
+HEADER = struct.Struct("<IIdH")
+CURSOR = struct.Struct("<qq")  # segment, offset of the next unread record
+
+Record = collections.namedtuple("Record", "topic payload enqueued_at segment end")
+
+
+class SegmentBuffer:
+    """
+    Bounded store-and-forward queue of (topic, payload) messages on disk.
+
+    Messages are appended to segment files of about `segment_bytes` each and
+    read back oldest first. A segment is deleted once it has been read, and
+    when the buffer would grow past `max_bytes` the oldest segment is dropped
+    as a whole, so an outage longer than the buffer can hold loses its oldest
+    samples rather than its newest. Only the open segments' file handles and
+    per-segment record counts live in memory, however large the backlog.
+
+    The read position is saved to `cursor` after each consumed batch, so a
+    gateway restart resumes where it left off; a crash re-sends at most the
+    batch in flight. Records carry a CRC, and a torn record at the end of
+    the last segment is cut off when the buffer is opened.
+    """
+
+    def __init__(self, directory, max_bytes=256 << 20, segment_bytes=8 << 20):
+        if max_bytes < 2 * segment_bytes:
+            raise ValueError("max_bytes must hold at least two segments")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self._sizes = {}   # segment -> bytes on disk
+        self._counts = {}  # segment -> unread records
+        self._read_seq = self._read_pos = 0
+        self._write_seq = 0
+        self._writer = None
+        self._reader = None
+        self._oldest = None  # enqueued_at of the next unread record
+
+        self.buffered = 0
+        self.drained = 0
+        self.dropped = 0
+
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        segments = sorted(
+            int(name[len("segment-"):-len(".buf")]) for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".buf")
+        )
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        cursor = (0, 0)
+        if os.path.exists(cursor_path):
+            with open(cursor_path, "rb") as f:
+                data = f.read()
+            if len(data) == CURSOR.size:
+                cursor = CURSOR.unpack(data)
+        for seq in segments:
+            if seq < cursor[0]:
+                # Fully read before the restart; its delete did not happen
+                os.remove(self._path(seq))
+                continue
+            start = min(cursor[1], os.path.getsize(self._path(seq))) if seq == cursor[0] else 0
+            if not self._sizes:
+                self._read_seq, self._read_pos = seq, start
+            self._sizes[seq], self._counts[seq] = self._scan(seq, start)
+        if self._sizes:
+            self._write_seq = max(self._sizes)
+        else:
+            self._read_seq = self._write_seq = cursor[0] + 1
+            self._read_pos = 0
+            self._sizes[self._write_seq] = 0
+            self._counts[self._write_seq] = 0
+        self._writer = open(self._path(self._write_seq), "ab")
+        self._peek_oldest()
+        backlog = sum(self._counts.values())
+        if backlog:
+            logger.info(f"Store-and-forward buffer holds {backlog} messages from before the restart")
+
+    def append(self, topic, payload):
+        topic_bytes = topic.encode("utf-8")
+        now = time.time()
+        record = HEADER.pack(len(payload), zlib.crc32(topic_bytes + payload), now, len(topic_bytes))
+        record += topic_bytes + payload
+        with self._lock:
+            if self._sizes[self._write_seq] >= self.segment_bytes:
+                self._roll()
+            while sum(self._sizes.values()) + len(record) > self.max_bytes and len(self._sizes) > 1:
+                self._drop_oldest()
+            self._writer.write(record)
+            # Survives a gateway crash; only a host crash can lose the OS cache
+            self._writer.flush()
+            self._sizes[self._write_seq] += len(record)
+            self._counts[self._write_seq] += 1
+            self.buffered += 1
+            if self._oldest is None:
+                self._oldest = now
+
+    def peek(self, limit):
+        """Up to `limit` of the oldest unread records, from a single segment; nothing is consumed."""
+        with self._lock:
+            if self._read_seq != self._write_seq and not self._counts[self._read_seq]:
+                self._finish_segment()
+            if not self._counts[self._read_seq]:
+                return []
+            if self._reader is None:
+                self._reader = open(self._path(self._read_seq), "rb")
+            self._reader.seek(self._read_pos)
+            records = []
+            position = self._read_pos
+            for _ in range(min(limit, self._counts[self._read_seq])):
+                payload_len, _, enqueued_at, topic_len = HEADER.unpack(self._reader.read(HEADER.size))
+                topic = self._reader.read(topic_len).decode("utf-8")
+                payload = self._reader.read(payload_len)
+                position += HEADER.size + topic_len + payload_len
+                records.append(Record(topic, payload, enqueued_at, self._read_seq, position))
+            return records
+
+    def consume(self, records):
+        """Mark `records`, a prefix of what peek() returned, as sent."""
+        if not records:
+            return
+        with self._lock:
+            last = records[-1]
+            if last.segment != self._read_seq:
+                return  # dropped as overflow in the meantime
+            consumed = sum(1 for record in records if record.end > self._read_pos)
+            self._read_pos = last.end
+            self._counts[self._read_seq] -= consumed
+            self.drained += consumed
+            self._save_cursor()
+            self._peek_oldest()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "capacity_bytes": self.max_bytes,
+                "used_bytes": sum(self._sizes.values()),
+                "segments": len(self._sizes),
+                "backlog": sum(self._counts.values()),
+                "oldest_age_s": round(time.time() - self._oldest, 1) if self._oldest is not None else 0.0,
+                "buffered": self.buffered,
+                "drained": self.drained,
+                "dropped": self.dropped,
+            }
+
+    def close(self):
+        with self._lock:
+            for handle in (self._writer, self._reader):
+                if handle is not None:
+                    handle.close()
+            self._writer = self._reader = None
+
+    # Internals below are called with _lock held
+
+    def _path(self, seq):
+        return os.path.join(self.directory, SEGMENT_NAME.format(seq))
+
+    def _scan(self, seq, start):
+        """Validate a segment from `start`; truncate it at the first bad record. Returns (size, records)."""
+        path = self._path(seq)
+        count = 0
+        with open(path, "r+b") as f:
+            f.seek(start)
+            position = start
+            while True:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                payload_len, crc, _, topic_len = HEADER.unpack(header)
+                body = f.read(topic_len + payload_len)
+                if len(body) < topic_len + payload_len or zlib.crc32(body) != crc:
+                    break
+                position += HEADER.size + len(body)
+                count += 1
+            if position < os.path.getsize(path):
+                logger.warning(f"Truncating torn record at {path}:{position}")
+                f.truncate(position)
+        return os.path.getsize(path), count
+
+    def _roll(self):
+        self._writer.close()
+        self._write_seq += 1
+        self._writer = open(self._path(self._write_seq), "ab")
+        self._sizes[self._write_seq] = 0
+        self._counts[self._write_seq] = 0
+
+    def _finish_segment(self):
+        """The read segment is exhausted and no longer written to: delete it."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        del self._sizes[self._read_seq]
+        del self._counts[self._read_seq]
+        os.remove(self._path(self._read_seq))
+        self._read_seq = min(self._sizes)
+        self._read_pos = 0
+        self._save_cursor()
+        self._peek_oldest()
+
+    def _drop_oldest(self):
+        if self._read_seq == self._write_seq:
+            self._roll()
+        lost = self._counts[self._read_seq]
+        self.dropped += lost
+        logger.warning(f"Store-and-forward buffer full, dropped {lost} oldest messages")
+        self._counts[self._read_seq] = 0
+        self._finish_segment()
+
+    def _save_cursor(self):
+        tmp = os.path.join(self.directory, CURSOR_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(CURSOR.pack(self._read_seq, self._read_pos))
+        os.replace(tmp, os.path.join(self.directory, CURSOR_FILE))
+
+    def _peek_oldest(self):
+        self._oldest = None
+        for seq in sorted(self._counts):
+            if self._counts[seq]:
+                position = self._read_pos if seq == self._read_seq else 0
+                with open(self._path(seq), "rb") as f:
+                    f.seek(position)
+                    self._oldest = HEADER.unpack(f.read(HEADER.size))[2]
+                return
@@ -0,0 +1,129 @@
+import time
+
+# Registry tag keys that turn on report-by-exception for a machine:
+#   deadband      absolute change that must be exceeded before the tag is reported
+#   deadband_pct  the same as a percentage of the tag's max - min range
+#                 (OPC UA's percent deadband over the EURange)
+#   compdev       swinging-door compression deviation, in the tag's unit
+# plus `heartbeat`: seconds after which a sample is sent however little changed.
+FILTER_KEYS = ("deadband", "deadband_pct", "compdev")
+
+
+def tag_deadband(tag):
+    if "deadband" in tag:
+        return float(tag["deadband"])
+    if "deadband_pct" in tag:
+        return float(tag["deadband_pct"]) / 100.0 * (float(tag["max"]) - float(tag["min"]))
+    return None
+
+
+class ReportFilter:
+    """
+    Report-by-exception for one machine's samples, configured per tag.
+
+    A sample whose timestamp did not advance is never sent. Without any of
+    FILTER_KEYS on the machine's tags every other sample is. Otherwise:
+
+      deadband tags  report once they differ from the last sent value by more
+                     than the deadband; holding the last sent value between
+                     samples stays within the deadband of what was measured
+      compdev tags   swinging door: a sample is held back while the straight
+                     line from the last sent sample to it passes within
+                     `compdev` of every sample in between, and is sent once
+                     the next one breaks that door; interpolating linearly
+                     between sent samples stays within `compdev`
+      other tags     report on any change
+
+    and no machine stays silent for longer than `heartbeat` seconds: offer()
+    forces a sample that far past the last sent one, and silent_for() lets the
+    caller notice a machine that offers nothing at all. Samples
+    carry every tag, so one is sent when any tag needs it; the extra points
+    only lower the error of the other tags.
+
+    offer() returns the samples to publish now, oldest first: none, the new
+    one, or the held-back one followed by the new one.
+    """
+
+    def __init__(self, tags, heartbeat=300.0):
+        self.deadbands = {tag["name"]: tag_deadband(tag) for tag in tags if "compdev" not in tag}
+        self.compdevs = {tag["name"]: float(tag["compdev"]) for tag in tags if "compdev" in tag}
+        heartbeats = [float(tag["heartbeat"]) for tag in tags if "heartbeat" in tag]
+        self.heartbeat = min(heartbeats) if heartbeats else heartbeat
+        self.active = any(key in tag for tag in tags for key in FILTER_KEYS)
+
+        self.previous = None   # last sample offered
+        self.last_sent = None  # also the origin of the doors
+        self.sent_at = None    # time.monotonic() of the last send
+        self.doors = {}        # tag -> (lowest upper slope, highest lower slope)
+
+        self.offered = 0
+        self.sent = 0
+
+    def offer(self, sample):
+        self.offered += 1
+        if self.previous is not None and sample["timestamp"] <= self.previous["timestamp"]:
+            return []
+        previous, self.previous = self.previous, sample
+        if not self.active or self.last_sent is None:
+            return self._send(sample)
+
+        # Sample time and the gateway's clock both count, so skew cannot hold a heartbeat back
+        elapsed = max((sample["timestamp"] - self.last_sent["timestamp"]).total_seconds(), self.silent_for())
+        forced = elapsed >= self.heartbeat or self._exceeds_deadband(sample)
+        out = []
+        if self.compdevs and not self._narrow_doors(sample):
+            # The door closed: the sample before this one ends the segment
+            if previous is not self.last_sent:
+                out += self._send(previous)
+            # A fresh door always takes one sample, unless a value is missing
+            forced = forced or not self._narrow_doors(sample)
+        if forced:
+            out += self._send(sample)
+        return out
+
+    def silent_for(self):
+        """Seconds since the last sample was sent, or None before the first."""
+        return None if self.sent_at is None else time.monotonic() - self.sent_at
+
+    def flush(self):
+        """The last sample if it was held back, e.g. at shutdown."""
+        if self.previous is None or self.previous is self.last_sent:
+            return []
+        return self._send(self.previous)
+
+    def _exceeds_deadband(self, sample):
+        for name, deadband in self.deadbands.items():
+            value, last = sample[name], self.last_sent[name]
+            if value is None or last is None:
+                if value is not last:
+                    return True
+            elif abs(value - last) > (deadband or 0.0):
+                return True
+        return False
+
+    def _narrow_doors(self, sample):
+        """
+        Check that the line from the last sent sample to `sample` lies in
+        every tag's door, then narrow the doors to `sample`'s own allowance.
+        False (doors unchanged) if the line misses a door. Testing the line
+        itself, not just whether the door is still open, keeps the bound strict.
+        """
+        dt = (sample["timestamp"] - self.last_sent["timestamp"]).total_seconds()
+        doors = {}
+        for name, compdev in self.compdevs.items():
+            value, origin = sample[name], self.last_sent[name]
+            if value is None or origin is None:
+                return False
+            upper, lower = self.doors.get(name, (float("inf"), float("-inf")))
+            if not lower <= (value - origin) / dt <= upper:
+                return False
+            doors[name] = (min(upper, (value + compdev - origin) / dt), max(lower, (value - compdev - origin) / dt))
+        self.doors = doors
+        return True
+
+    def _send(self, sample):
+        self.last_sent = sample
+        self.sent_at = time.monotonic()
+        self.doors = {}
+        self.sent += 1
+        return [sample]
@@ -1,11 +1,18 @@
+import os
 import time
 import json
+import struct
 import logging
 import datetime
 import socket
 import threading
 from opcua import Server
+from opcua import ua
 import paho.mqtt.client as mqtt
+from registry import load_registry
+from buffer import SegmentBuffer
+from payload import MAX_SAMPLES, encode_batch, encode_json, type_code
+from deadband import ReportFilter
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,18 +23,61 @@ logging.getLogger("paho").setLevel(logging.CRITICAL)
 # OPC UA Server settings
 SERVER_ENDPOINT = "opc.tcp://0.0.0.0:4840"
 SERVER_NAME = "OPC UA Gateway Server"
-NAMESPACE = "SENSOR_DATA"
 
 # MQTT settings
 MQTT_BROKER = "mqtt-broker"
 MQTT_PORT = 1883
 MQTT_CLIENT_ID = "opcua_gateway"
-TOPIC_MACHINE1 = "machine1/sensor"
-TOPIC_MACHINE2 = "machine2/sensor"
+
+# Publishing mode: "subscription" pushes a sample to MQTT as soon as a machine
+# writes it (OPC UA data-change notifications), "poll" reads all nodes on a timer.
+GATEWAY_MODE = os.getenv("GATEWAY_MODE", "subscription")
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", "5"))
+SUBSCRIPTION_PERIOD_MS = int(os.getenv("SUBSCRIPTION_PERIOD_MS", "100"))
+# Writes queued per monitored item within one publishing period, so back-to-back
+# samples are not collapsed into the latest value
+SUBSCRIPTION_QUEUE_SIZE = int(os.getenv("SUBSCRIPTION_QUEUE_SIZE", "10"))
+
+# Report-by-exception is configured per tag in the registry (deadband,
+# deadband_pct, compdev, heartbeat; see deadband.py). A filtered machine sends
+# a sample at least every HEARTBEAT_INTERVAL seconds unless its tags set their own.
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "300"))
+# Seconds between checks for filtered machines that went quiet: a machine whose
+# values stop changing offers no samples, so its heartbeat is sent from here
+HEARTBEAT_CHECK_INTERVAL = float(os.getenv("HEARTBEAT_CHECK_INTERVAL", "5"))
+# Seconds between log lines on how many samples the filters let through
+FILTER_STATS_INTERVAL = float(os.getenv("FILTER_STATS_INTERVAL", "60"))
+
+# Payload format on the machine topics (see payload.py): "json" publishes each
+# sample as it completes; "binary" packs up to BATCH_SAMPLES samples of a
+# machine into one message, sent at most BATCH_LATENCY seconds after its first.
+PAYLOAD_FORMAT = os.getenv("PAYLOAD_FORMAT", "json")
+BATCH_SAMPLES = min(int(os.getenv("BATCH_SAMPLES", "50")), MAX_SAMPLES)
+BATCH_LATENCY = float(os.getenv("BATCH_LATENCY", "1.0"))
+
+# Store-and-forward: samples that cannot be published while the broker is
+# unreachable go to segment files in BUFFER_DIR (at most BUFFER_MAX_BYTES, the
+# oldest are dropped beyond that) and are replayed at BUFFER_DRAIN_RATE
+# messages/s once it is back, alongside live samples. Empty BUFFER_DIR disables it.
+BUFFER_DIR = os.getenv("BUFFER_DIR", "/data/buffer")
+BUFFER_MAX_BYTES = int(os.getenv("BUFFER_MAX_BYTES", str(256 << 20)))
+BUFFER_SEGMENT_BYTES = int(os.getenv("BUFFER_SEGMENT_BYTES", str(8 << 20)))
+BUFFER_DRAIN_RATE = float(os.getenv("BUFFER_DRAIN_RATE", "500"))
+BUFFER_DRAIN_BATCH = int(os.getenv("BUFFER_DRAIN_BATCH", "100"))
+# Seconds between buffer status reports; each is logged and published (retained) to BUFFER_STATUS_TOPIC
+BUFFER_STATS_INTERVAL = float(os.getenv("BUFFER_STATS_INTERVAL", "30"))
+BUFFER_STATUS_TOPIC = os.getenv("BUFFER_STATUS_TOPIC", "gateway/status/buffer")
 
 # Global flag for MQTT connection
 mqtt_connected = False
 
+# SegmentBuffer when store-and-forward is enabled
+outage_buffer = None
+
+# Binary batches being filled: topic -> (tags, [(timestamp, value, ...)], started)
+pending_batches = {}
+publish_lock = threading.Lock()
+
 def on_connect(client, userdata, flags, rc, properties=None):
     global mqtt_connected
     if rc == 0:
@@ -64,35 +114,269 @@ def mqtt_connection_manager(client):
                 logger.error(f"MQTT connection error: {e}")
         time.sleep(10)
 
+def publish_payload(client, topic, payload):
+    """Publish, or keep in the store-and-forward buffer while that fails. Call with publish_lock held."""
+    if mqtt_connected:
+        result = client.publish(topic, payload)
+        if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            logger.debug(f"Published {len(payload)} bytes to {topic}")
+            return
+        logger.warning(f"Failed to publish to {topic}, code: {result.rc}")
+    if outage_buffer is None:
+        logger.info("MQTT not connected, skipping publish")
+        return
+    # Kept on disk until drain_buffer() gets it to the broker
+    outage_buffer.append(topic, payload)
+
+def publish_sample(client, machine, sample):
+    with publish_lock:
+        # Report by exception; compression may also release a held-back sample
+        for report in machine["filter"].offer(sample):
+            send_sample(client, machine, report)
+
+def send_sample(client, machine, sample):
+    """Publish as JSON, or add to the machine's binary batch. Call with publish_lock held."""
+    topic = machine["topic"]
+    if PAYLOAD_FORMAT != "binary":
+        publish_payload(client, topic, encode_json(sample))
+        return
+    tags = machine["types"]
+    batch = pending_batches.setdefault(topic, (tags, [], time.monotonic()))
+    batch[1].append((sample["timestamp"], *(sample[name] for name, _ in tags)))
+    if len(batch[1]) >= BATCH_SAMPLES:
+        flush_batch(client, topic)
+
+def flush_batch(client, topic):
+    """Publish the pending binary batch of `topic`. Call with publish_lock held."""
+    tags, samples, _ = pending_batches.pop(topic)
+    try:
+        payloads = [encode_batch(tags, samples)]
+    except (ValueError, struct.error) as e:
+        # Readers take JSON as well, so fall back rather than lose the samples
+        logger.warning(f"Publishing {len(samples)} samples on {topic} as JSON: {e}")
+        names = ["timestamp"] + [name for name, _ in tags]
+        payloads = [encode_json(dict(zip(names, sample))) for sample in samples]
+    for payload in payloads:
+        publish_payload(client, topic, payload)
+
+def flush_batches(client):
+    """Send binary batches that have waited BATCH_LATENCY seconds, however few samples they hold."""
+    while True:
+        time.sleep(BATCH_LATENCY / 4)
+        cutoff = time.monotonic() - BATCH_LATENCY
+        with publish_lock:
+            for topic in [topic for topic, (_, _, started) in pending_batches.items() if started <= cutoff]:
+                flush_batch(client, topic)
+
+def send_heartbeats(client, machines):
+    """
+    Re-read and publish filtered machines that have sent nothing for their
+    heartbeat. The values are the ones still held by the nodes, stamped with
+    the current time so the filter sees the sample advance.
+    """
+    filtered = [machine for machine in machines.values() if machine["filter"].active]
+    while True:
+        time.sleep(HEARTBEAT_CHECK_INTERVAL)
+        for machine in filtered:
+            report_filter = machine["filter"]
+            silent = report_filter.silent_for()
+            if silent is None or silent < report_filter.heartbeat:
+                continue
+            values = {}
+            for tag, node in machine["nodes"].items():
+                dv = node.get_data_value()
+                values[tag] = (dv.Value.Value, dv.SourceTimestamp)
+            sample = complete_sample(values)
+            # Mid-write: the write itself is about to be offered
+            if sample is None:
+                continue
+            # Never behind the last offered sample, whatever the machine's clock says
+            sample["timestamp"] = max(datetime.datetime.utcnow(),
+                                      report_filter.previous["timestamp"] + datetime.timedelta(seconds=1))
+            publish_sample(client, machine, sample)
+
+def report_filters(machines):
+    """Log how many samples the report-by-exception filters let through."""
+    filters = [machine["filter"] for machine in machines.values() if machine["filter"].active]
+    last_offered, last_sent = 0, 0
+    while True:
+        time.sleep(FILTER_STATS_INTERVAL)
+        offered, sent = sum(f.offered for f in filters), sum(f.sent for f in filters)
+        if offered > last_offered:
+            logger.info(
+                f"Report-by-exception: sent {sent - last_sent} of {offered - last_offered} samples "
+                f"from {len(filters)} filtered machines ({(sent - last_sent) / (offered - last_offered):.1%})"
+            )
+        last_offered, last_sent = offered, sent
+
+def drain_buffer(client):
+    """Replay buffered samples, oldest first, at no more than BUFFER_DRAIN_RATE messages/s while connected."""
+    while True:
+        if not mqtt_connected:
+            time.sleep(1)
+            continue
+        started = time.monotonic()
+        records = outage_buffer.peek(BUFFER_DRAIN_BATCH)
+        if not records:
+            time.sleep(0.5)
+            continue
+        sent = []
+        for record in records:
+            # Live samples are published from other threads in between
+            if client.publish(record.topic, record.payload).rc != mqtt.MQTT_ERR_SUCCESS:
+                break
+            sent.append(record)
+        outage_buffer.consume(sent)
+        if len(sent) < len(records):
+            time.sleep(1)
+            continue
+        time.sleep(max(len(sent) / BUFFER_DRAIN_RATE - (time.monotonic() - started), 0))
+
+def report_buffer(client):
+    """Log the buffer's fill, backlog age and achieved drain rate, and publish them as retained JSON."""
+    last_drained, last_at = outage_buffer.drained, time.monotonic()
+    while True:
+        time.sleep(BUFFER_STATS_INTERVAL)
+        stats = outage_buffer.stats()
+        now = time.monotonic()
+        stats["drain_rate_limit"] = BUFFER_DRAIN_RATE
+        stats["drained_per_s"] = round((stats["drained"] - last_drained) / (now - last_at), 1)
+        last_drained, last_at = stats["drained"], now
+        if stats["backlog"] or stats["drained_per_s"]:
+            logger.info(
+                f"Store-and-forward: backlog {stats['backlog']} messages, oldest {stats['oldest_age_s']}s, "
+                f"{stats['used_bytes']}/{stats['capacity_bytes']} bytes, "
+                f"draining {stats['drained_per_s']}/s (limit {BUFFER_DRAIN_RATE:g}), dropped {stats['dropped']}"
+            )
+        if mqtt_connected:
+            client.publish(BUFFER_STATUS_TOPIC, json.dumps(stats), retain=True)
+
+def complete_sample(values):
+    """
+    Turn {tag: (value, SourceTimestamp)} into a publishable sample.
+
+    Machines write all tags of a sample in one WriteRequest stamped with one
+    SourceTimestamp, so the sample is complete once every tag carries the same
+    timestamp. Returns None while tags still disagree (a write in progress).
+    """
+    timestamps = {ts for _, ts in values.values()}
+    if len(timestamps) != 1:
+        return None
+    source_ts = timestamps.pop()
+    if source_ts is None:
+        return None
+    sample = {"timestamp": source_ts}
+    for tag, (value, _) in values.items():
+        sample[tag] = value
+    return sample
+
+class SubHandler:
+    """
+    Server-side data-change handler for the machine variables.
+
+    Notifications are collected per machine and the sample is published as
+    soon as all of its tags report the same SourceTimestamp. Lookups are by
+    NodeId, so the cost per notification does not depend on how many machines
+    the gateway serves.
+
+    The server only notifies on a value change, so a tag that repeats its
+    value keeps the SourceTimestamp of an older write. Such tags are re-read
+    when another tag moves ahead; the write stamped them too.
+    """
+
+    def __init__(self, mqtt_client, machines):
+        self.mqtt_client = mqtt_client
+        self.machines = machines
+        self.node_tags = {}
+        self.values = {}
+        for machine_id, machine in machines.items():
+            self.values[machine_id] = {}
+            for tag, node in machine["nodes"].items():
+                self.node_tags[node.nodeid] = (machine_id, tag)
+
+    def datachange_notification(self, node, val, data):
+        machine_id, tag = self.node_tags[node.nodeid]
+        machine = self.machines[machine_id]
+        values = self.values[machine_id]
+        values[tag] = (val, data.monitored_item.Value.SourceTimestamp)
+        newest = max((ts for _, ts in values.values() if ts is not None), default=None)
+        if newest is None:
+            return
+        for other, node in machine["nodes"].items():
+            if other not in values or values[other][1] != newest:
+                dv = node.get_data_value()
+                values[other] = (dv.Value.Value, dv.SourceTimestamp)
+        sample = complete_sample(values)
+        # A sample already sent for this timestamp is dropped by the machine's ReportFilter
+        if sample is not None:
+            publish_sample(self.mqtt_client, machine, sample)
+
+def add_machine(parent, nsidx, machine):
+    machine_id = machine["id"]
+    folder = parent.add_folder(nsidx, machine_id)
+    nodes = {}
+    for tag in machine["tags"]:
+        nodes[tag["name"]] = folder.add_variable(
+            f"ns={nsidx};s={machine_id}_{tag['node']}", tag["node"], 0.0,
+            varianttype=getattr(ua.VariantType, tag.get("type", "Double"))
+        )
+    for node in nodes.values():
+        node.set_writable()
+    # Tag order and packing of this machine's binary batches
+    types = [(tag["name"], type_code(tag.get("type", "Double"))) for tag in machine["tags"]]
+    return {
+        "topic": machine["topic"],
+        "nodes": nodes,
+        "types": types,
+        "filter": ReportFilter(machine["tags"], heartbeat=HEARTBEAT_INTERVAL),
+    }
+
+def build_read_request(machines):
+    """One ReadParameters covering every machine variable, plus the (machine, tag) of each slot."""
+    params = ua.ReadParameters()
+    params.TimestampsToReturn = ua.TimestampsToReturn.Source
+    slots = []
+    for machine_id, machine in machines.items():
+        for tag, node in machine["nodes"].items():
+            rv = ua.ReadValueId()
+            rv.NodeId = node.nodeid
+            rv.AttributeId = ua.AttributeIds.Value
+            params.NodesToRead.append(rv)
+            slots.append((machine_id, tag))
+    return params, slots
+
+def poll_loop(server, mqtt_client, machines):
+    params, slots = build_read_request(machines)
+    while True:
+        # A single bulk read against the address space instead of one read per node
+        results = server.iserver.isession.read(params)
+        values = {machine_id: {} for machine_id in machines}
+        for (machine_id, tag), dv in zip(slots, results):
+            values[machine_id][tag] = (dv.Value.Value, dv.SourceTimestamp)
+        for machine_id, machine_values in values.items():
+            # A machine caught mid-write is picked up on the next poll
+            sample = complete_sample(machine_values)
+            if sample is not None:
+                publish_sample(mqtt_client, machines[machine_id], sample)
+        time.sleep(POLL_INTERVAL)
+
 def main():
+    global outage_buffer
+    namespace, registry = load_registry()
+
     # Initialize OPC UA server
     server = Server()
     server.set_endpoint(SERVER_ENDPOINT)
     server.set_server_name(SERVER_NAME)
-    nsidx = server.register_namespace(NAMESPACE)
-    logger.info(f"Registered namespace '{NAMESPACE}' with index {nsidx}")
+    nsidx = server.register_namespace(namespace)
+    logger.info(f"Registered namespace '{namespace}' with index {nsidx}")
 
-    # Create folder structure for sensors
+    # Create folder structure for sensors, one folder per registered machine
     objects = server.get_objects_node()
     sensors_folder = objects.add_folder(nsidx, "Sensors")
 
-    # Machine1 nodes
-    m1_folder = sensors_folder.add_folder(nsidx, "Machine1")
-    m1_temp = m1_folder.add_variable(f"ns={nsidx};s=Machine1_Temperature", "Temperature", 0.0)
-    m1_press = m1_folder.add_variable(f"ns={nsidx};s=Machine1_Pressure", "Pressure", 0.0)
-    m1_ts = m1_folder.add_variable(f"ns={nsidx};s=Machine1_Timestamp", "Timestamp", "")
-    m1_temp.set_writable()
-    m1_press.set_writable()
-    m1_ts.set_writable()
-
-    # Machine2 nodes
-    m2_folder = sensors_folder.add_folder(nsidx, "Machine2")
-    m2_temp = m2_folder.add_variable(f"ns={nsidx};s=Machine2_Temperature", "Temperature", 0.0)
-    m2_press = m2_folder.add_variable(f"ns={nsidx};s=Machine2_Pressure", "Pressure", 0.0)
-    m2_ts = m2_folder.add_variable(f"ns={nsidx};s=Machine2_Timestamp", "Timestamp", "")
-    m2_temp.set_writable()
-    m2_press.set_writable()
-    m2_ts.set_writable()
+    machines = {machine["id"]: add_machine(sensors_folder, nsidx, machine) for machine in registry}
+    logger.info(f"Created address space for {len(machines)} machines")
 
     server.start()
     logger.info(f"OPC UA Server started at {SERVER_ENDPOINT}")
@@ -102,59 +386,50 @@ def main():
     mqtt_thread = threading.Thread(target=mqtt_connection_manager, args=(mqtt_client,), daemon=True)
     mqtt_thread.start()
 
-    # Initialize last payloads as None for change detection
-    last_m1_payload = None
-    last_m2_payload = None
+    if BUFFER_DIR:
+        outage_buffer = SegmentBuffer(BUFFER_DIR, max_bytes=BUFFER_MAX_BYTES, segment_bytes=BUFFER_SEGMENT_BYTES)
+        outage_buffer.open()
+        threading.Thread(target=drain_buffer, args=(mqtt_client,), daemon=True).start()
+        threading.Thread(target=report_buffer, args=(mqtt_client,), daemon=True).start()
+        logger.info(f"Store-and-forward buffer in {BUFFER_DIR} ({BUFFER_MAX_BYTES} bytes)")
+
+    filtered = sum(1 for machine in machines.values() if machine["filter"].active)
+    if filtered:
+        threading.Thread(target=report_filters, args=(machines,), daemon=True).start()
+        threading.Thread(target=send_heartbeats, args=(mqtt_client, machines), daemon=True).start()
+        logger.info(f"Report-by-exception filtering on {filtered} machines")
+
+    if PAYLOAD_FORMAT == "binary":
+        threading.Thread(target=flush_batches, args=(mqtt_client,), daemon=True).start()
+        logger.info(f"Publishing binary batches of up to {BATCH_SAMPLES} samples every {BATCH_LATENCY}s")
 
+    subscription = None
     try:
-        while True:
-            # Read Machine1 sensor values
-            m1_temp_val = m1_temp.get_value()
-            m1_press_val = m1_press.get_value()
-            m1_ts_val = m1_ts.get_value()
-
-            # Read Machine2 sensor values
-            m2_temp_val = m2_temp.get_value()
-            m2_press_val = m2_press.get_value()
-            m2_ts_val = m2_ts.get_value()
-
-            payload_m1 = json.dumps({
-                "timestamp": m1_ts_val,
-                "temperature": m1_temp_val,
-                "pressure": m1_press_val
-            })
-            payload_m2 = json.dumps({
-                "timestamp": m2_ts_val,
-                "temperature": m2_temp_val,
-                "pressure": m2_press_val
-            })
-
-            if mqtt_connected:
-                # Publish only if payload has changed for Machine1
-                if payload_m1 != last_m1_payload:
-                    result1 = mqtt_client.publish(TOPIC_MACHINE1, payload_m1)
-                    if result1.rc == mqtt.MQTT_ERR_SUCCESS:
-                        logger.info(f"Published to {TOPIC_MACHINE1}: {payload_m1}")
-                        last_m1_payload = payload_m1
-                    else:
-                        logger.warning(f"Failed to publish to {TOPIC_MACHINE1}, code: {result1.rc}")
-
-                # Publish only if payload has changed for Machine2
-                if payload_m2 != last_m2_payload:
-                    result2 = mqtt_client.publish(TOPIC_MACHINE2, payload_m2)
-                    if result2.rc == mqtt.MQTT_ERR_SUCCESS:
-                        logger.info(f"Published to {TOPIC_MACHINE2}: {payload_m2}")
-                        last_m2_payload = payload_m2
-                    else:
-                        logger.warning(f"Failed to publish to {TOPIC_MACHINE2}, code: {result2.rc}")
-            else:
-                logger.info("MQTT not connected, skipping publish")
-
-            time.sleep(5)
+        if GATEWAY_MODE == "poll":
+            logger.info(f"Polling machine variables every {POLL_INTERVAL}s")
+            poll_loop(server, mqtt_client, machines)
+        else:
+            handler = SubHandler(mqtt_client, machines)
+            subscription = server.create_subscription(SUBSCRIPTION_PERIOD_MS, handler)
+            nodes = [node for m in machines.values() for node in m["nodes"].values()]
+            subscription.subscribe_data_change(nodes, queuesize=SUBSCRIPTION_QUEUE_SIZE)
+            logger.info(f"Subscribed to data changes on {len(handler.node_tags)} variables")
+            while True:
+                time.sleep(60)
     except KeyboardInterrupt:
         logger.info("Shutting down gateway...")
     finally:
+        if subscription is not None:
+            subscription.delete()
+        with publish_lock:
+            for machine in machines.values():
+                for sample in machine["filter"].flush():
+                    send_sample(mqtt_client, machine, sample)
+            for topic in list(pending_batches):
+                flush_batch(mqtt_client, topic)
         mqtt_client.loop_stop()
+        if outage_buffer is not None:
+            outage_buffer.close()
         server.stop()
         logger.info("OPC UA Server stopped")
 
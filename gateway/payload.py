@@ -0,0 +1,121 @@
+import json
+import struct
+import functools
+from datetime import datetime, timedelta, timezone
+
+# Sample payload formats on the machine topics, shared by the gateway and mqtt-client.
+#
+# json    one sample per message, the original format:
+#         {"timestamp": "2025-03-28T05:46:57.513491", "temperature": 27.1, ...}
+#         with the timestamp in UTC; one with a UTC offset is converted to UTC
+# binary  many samples of one machine per message:
+#           header   <2sBBHq  magic b"SB", version, tag count, sample count,
+#                             base timestamp (ms since the Unix epoch, UTC)
+#           tags     per tag: name length (uint8), UTF-8 name, type code
+#                    (b"f" float32 for OPC UA Float tags, b"d" float64 otherwise)
+#           samples  per sample: ms after the base (uint32), then one value
+#                    per tag in tag order, little endian
+#
+# Readers tell the formats apart by the first byte: JSON starts with "{",
+# binary with the magic, and its version byte says how to read the rest.
+# MQTT 3.1.1 has no content-type property, so the payload carries it itself.
+MAGIC = b"SB"
+VERSION = 1
+HEADER = struct.Struct("<2sBBHq")
+EPOCH = datetime(1970, 1, 1)
+MS = timedelta(milliseconds=1)
+
+# Sample timestamp offsets are uint32 ms, so one batch may span ~49 days
+MAX_SPAN_MS = 2 ** 32 - 1
+MAX_SAMPLES = 2 ** 16 - 1
+
+# OPC UA variant type -> struct code; integers and booleans fit a double exactly
+TYPE_CODES = {"Float": "f"}
+
+
+def type_code(variant_type):
+    return TYPE_CODES.get(variant_type, "d")
+
+
+def epoch_ms(timestamp):
+    """Naive UTC datetime -> integer ms since the epoch."""
+    return (timestamp - EPOCH) // MS
+
+
+@functools.lru_cache(maxsize=None)
+def sample_struct(codes):
+    """Struct of one sample: ms after the batch base, then a value per type code."""
+    return struct.Struct("<I" + codes)
+
+
+def encode_json(sample):
+    """`sample` is {"timestamp": datetime, tag: value, ...}."""
+    return json.dumps({**sample, "timestamp": sample["timestamp"].isoformat()}).encode()
+
+
+def encode_batch(tags, samples):
+    """
+    `tags` is [(name, type code)], `samples` a list of (timestamp, value, ...)
+    tuples with one value per tag, timestamps naive UTC datetimes.
+    """
+    stamps = [epoch_ms(sample[0]) for sample in samples]
+    base = min(stamps)
+    if len(samples) > MAX_SAMPLES or max(stamps) - base > MAX_SPAN_MS:
+        raise ValueError("Batch exceeds the sample count or time span of the binary format")
+    packer = sample_struct("".join(code for _, code in tags))
+    parts = [HEADER.pack(MAGIC, VERSION, len(tags), len(samples), base)]
+    for name, code in tags:
+        name_bytes = name.encode("utf-8")
+        parts.append(bytes([len(name_bytes)]) + name_bytes + code.encode())
+    for stamp, sample in zip(stamps, samples):
+        parts.append(packer.pack(stamp - base, *sample[1:]))
+    return b"".join(parts)
+
+
+def decode(payload):
+    """
+    Either format -> (tag names, [(timestamp, value, ...)]), timestamps as
+    naive UTC datetimes. Raises ValueError for anything it cannot read.
+    """
+    if payload[:1] == b"{":
+        data = json.loads(payload)
+        timestamp = data.pop("timestamp", None)
+        if not isinstance(timestamp, str):
+            raise ValueError("JSON sample without a timestamp")
+        sample_time = datetime.fromisoformat(timestamp)
+        if sample_time.tzinfo is not None:
+            # Everything downstream works in naive UTC; never mix the two in a batch
+            sample_time = sample_time.astimezone(timezone.utc).replace(tzinfo=None)
+        tags = list(data)
+        return tags, [(sample_time, *data.values())]
+    if len(payload) < HEADER.size or payload[:2] != MAGIC:
+        raise ValueError("Unknown payload format")
+    try:
+        return decode_batch(payload)
+    except (struct.error, IndexError, OverflowError, UnicodeDecodeError) as e:
+        raise ValueError(f"Corrupt binary payload: {e}") from e
+
+
+def decode_batch(payload):
+    _, version, tag_count, sample_count, base = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"Unsupported binary payload version {version}")
+    offset = HEADER.size
+    tags, codes = [], []
+    for _ in range(tag_count):
+        # Name length byte, the name and its type code must all be there
+        if offset >= len(payload) or offset + payload[offset] + 2 > len(payload):
+            raise ValueError("Truncated binary payload tag table")
+        length = payload[offset]
+        tags.append(payload[offset + 1:offset + 1 + length].decode("utf-8"))
+        code = chr(payload[offset + 1 + length])
+        if code not in "fd":
+            raise ValueError(f"Unknown type code {code!r} in binary payload")
+        codes.append(code)
+        offset += length + 2
+    unpacker = sample_struct("".join(codes))
+    if len(payload) - offset != unpacker.size * sample_count:
+        raise ValueError("Truncated binary payload")
+    base_time = EPOCH + base * MS
+    samples = [(base_time + delta * MS, *values) for delta, *values in unpacker.iter_unpack(payload[offset:])]
+    return tags, samples
@@ -0,0 +1,75 @@
+import os
+import json
+import logging
+
+logger = logging.getLogger("gateway.registry")
+
+# Machine and tag registry shared by the gateway, the simulators and mqtt-client
+MACHINE_REGISTRY = os.getenv("MACHINE_REGISTRY", "/config/machines.json")
+
+# Used when no registry file is mounted: the two machines of the default compose setup
+DEFAULT_REGISTRY = {
+    "namespace": "SENSOR_DATA",
+    "tags": {
+        "temperature": {"node": "Temperature", "type": "Float", "min": 20.0, "max": 35.0},
+        "pressure": {"node": "Pressure", "type": "Float", "min": 995.0, "max": 1025.0},
+    },
+    "default_tags": ["temperature", "pressure"],
+    "machines": [
+        {"id": "Machine1", "topic": "machine1/sensor"},
+        {"id": "Machine2", "topic": "machine2/sensor"},
+    ],
+}
+
+
+def default_topic(machine_id):
+    return f"{machine_id.lower()}/sensor"
+
+
+def load_registry(path=MACHINE_REGISTRY):
+    """
+    Load the registry and expand it into a flat list of machines.
+
+    Each machine comes back as {"id", "topic", "tags"} where "tags" is a list of
+    {"name", "node", "type", "min", "max"} dicts, plus any report-by-exception
+    settings of the tag (see deadband.py). Explicit "machines" entries are
+    taken as-is; each "fleets" entry expands to `count` machines named
+    prefix+start, prefix+start+1, ... so hundreds of machines need one line.
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            registry = json.load(f)
+        logger.info(f"Loaded machine registry from {path}")
+    else:
+        logger.warning(f"Machine registry {path} not found, using built-in Machine1/Machine2")
+        registry = DEFAULT_REGISTRY
+
+    catalog = registry["tags"]
+    default_tags = registry.get("default_tags", list(catalog))
+
+    def resolve_tags(names):
+        tags = []
+        for name in names:
+            if name not in catalog:
+                raise ValueError(f"Unknown tag '{name}' in machine registry")
+            tags.append(dict(catalog[name], name=name))
+        return tags
+
+    machines = []
+    for entry in registry.get("machines", []):
+        machines.append({
+            "id": entry["id"],
+            "topic": entry.get("topic", default_topic(entry["id"])),
+            "tags": resolve_tags(entry.get("tags", default_tags)),
+        })
+    for fleet in registry.get("fleets", []):
+        tags = resolve_tags(fleet.get("tags", default_tags))
+        start = fleet.get("start", 1)
+        for n in range(start, start + fleet.get("count", 0)):
+            machine_id = f"{fleet['prefix']}{n}"
+            machines.append({"id": machine_id, "topic": default_topic(machine_id), "tags": tags})
+
+    ids = [m["id"] for m in machines]
+    if len(ids) != len(set(ids)):
+        raise ValueError("Duplicate machine IDs in machine registry")
+    return registry.get("namespace", "SENSOR_DATA"), machines
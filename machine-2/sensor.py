@@ -22,6 +22,11 @@ TEMP_MAX = 35.0
 PRESS_MIN = 995.0
 PRESS_MAX = 1025.0
 
+def stamped(value, timestamp):
+    dv = ua.DataValue(ua.Variant(value, ua.VariantType.Float))
+    dv.SourceTimestamp = timestamp
+    return dv
+
 def main():
     client = Client(OPCUA_SERVER_URL)
     connected = False
@@ -41,18 +46,20 @@ def main():
 
         temp_node = client.get_node(f"ns={nsidx};s={MACHINE_ID}_Temperature")
         press_node = client.get_node(f"ns={nsidx};s={MACHINE_ID}_Pressure")
-        ts_node = client.get_node(f"ns={nsidx};s={MACHINE_ID}_Timestamp")
 
         while True:
             temp = round(random.uniform(TEMP_MIN, TEMP_MAX), 2)
             press = round(random.uniform(PRESS_MIN, PRESS_MAX), 2)
-            current_time = datetime.datetime.now().isoformat()
+            # OPC UA timestamps are UTC; the sample time travels as the SourceTimestamp
+            current_time = datetime.datetime.utcnow()
 
-            temp_node.set_value(ua.DataValue(ua.Variant(temp, ua.VariantType.Float)))
-            press_node.set_value(ua.DataValue(ua.Variant(press, ua.VariantType.Float)))
-            ts_node.set_value(ua.DataValue(ua.Variant(current_time, ua.VariantType.String)))
+            # All tags of a sample go out in a single WriteRequest with one shared SourceTimestamp
+            client.set_values(
+                [temp_node, press_node],
+                [stamped(temp, current_time), stamped(press, current_time)]
+            )
 
-            logger.info(f"Machine2 - Temperature: {temp}°C, Pressure: {press} hPa, Timestamp: {current_time}")
+            logger.info(f"Machine2 - Temperature: {temp}°C, Pressure: {press} hPa, Timestamp: {current_time.isoformat()}")
             time.sleep(SAMPLE_INTERVAL)
     except Exception as e:
         logger.error(f"Error: {e}")
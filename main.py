@@ -1,10 +1,14 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
-import requests
+from fastapi.responses import HTMLResponse, Response
+import httpx
 import json
+import hashlib
+import time
+import asyncio
+from collections import OrderedDict
 from jinja2 import Environment, DictLoader
 from datetime import datetime, timedelta
-import statistics
+import numpy as np
 
 app = FastAPI()
 
@@ -13,6 +17,110 @@ app = FastAPI()
 # ---------------------------------------------------------------------------
 API_KEY = "satyaprakashreddy6789"
 API_URL = "http://localhost:8001/sensors"
+# Upper bound on chart points per machine; the sensors API downsamples wider ranges
+MAX_POINTS = 1000
+# Raw records per page in the dashboard table
+ROWS_PAGE_SIZE = 100
+# Live mode keeps statistics as per-machine aggregates of LIVE_BUCKET (one of the
+# sensors API's bucket widths, LIVE_BUCKET_SECONDS wide), so rows leaving the
+# 24 hour window can be taken out of them again
+LIVE_BUCKET = "5m"
+LIVE_BUCKET_SECONDS = 300
+# Live change feed served by ws_server.py (uvicorn ws_server:app --port 8003)
+WS_URL = "ws://localhost:8003/ws"
+
+# Sensor API responses are cached for CACHE_TTL seconds (LRU beyond CACHE_SIZE windows).
+# The default "last 24 hours" window is aligned to CACHE_TTL so wall displays share entries.
+CACHE_TTL = 10
+CACHE_SIZE = 128
+
+# ---------------------------------------------------------------------------
+# Sensor API Client: persistent connection pool, response cache, coalescing
+# ---------------------------------------------------------------------------
+http_client = None
+
+class ResponseCache:
+    """
+    TTL + LRU cache for sensor API responses. Concurrent requests for a key
+    that is not cached share a single upstream call instead of each making one.
+    """
+
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}  # key -> task fetching the value
+
+    async def get(self, key, fetch):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            return entry[1]
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._store(key, t))
+        # A waiter going away (client disconnect) must not cancel the shared fetch
+        return await asyncio.shield(task)
+
+    def _store(self, key, task):
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+sensor_cache = ResponseCache(CACHE_TTL, CACHE_SIZE)
+
+@app.on_event("startup")
+async def open_http_client():
+    global http_client
+    http_client = httpx.AsyncClient(
+        headers={"X-API-KEY": API_KEY},
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+        timeout=30.0,
+    )
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await http_client.aclose()
+
+async def fetch_cached(url: str, params: dict):
+    """A sensor API response, served from cache or one shared upstream call."""
+    async def fetch():
+        api_response = await http_client.get(url, params=params)
+        api_response.raise_for_status()
+        sensor_data = api_response.json()
+
+        # If the response is a string, attempt to parse it.
+        if isinstance(sensor_data, str):
+            sensor_data = json.loads(sensor_data)
+
+        # If the sensor API returns a dict with a "data" key, use that.
+        if isinstance(sensor_data, dict) and "data" in sensor_data:
+            sensor_data = sensor_data["data"]
+        return sensor_data
+
+    return await sensor_cache.get((url, *params.items()), fetch)
+
+async def fetch_sensor_data(start_str: str, end_str: str, bucket: str = None, max_points: int = MAX_POINTS,
+                            limit: int = None, offset: int = None):
+    """Sensor rows for a window."""
+    params = {"start": start_str, "end": end_str}
+    for name, value in (("bucket", bucket), ("max_points", max_points), ("limit", limit), ("offset", offset)):
+        if value is not None:
+            params[name] = value
+    return await fetch_cached(API_URL, params)
+
+async def fetch_sensor_stats(start_str: str, end_str: str, bucket: str = None):
+    """Per-machine statistics for a window (and per `bucket` when given), computed by the sensors API."""
+    params = {"start": start_str, "end": end_str}
+    if bucket is not None:
+        params["bucket"] = bucket
+    return await fetch_cached(API_URL + "/stats", params)
 
 # ---------------------------------------------------------------------------
 # In-Memory Jinja2 Templates (Dashboard)
@@ -55,38 +163,23 @@ templates_dict = {
     {% extends "layout.html" %}
     {% block content %}
     <h1 class="mb-4">Cyberpunk Dashboard</h1>
-    <!-- Filter Form -->
-    <form method="get" class="row g-3 align-items-end">
+    <!-- Filter Form: ranges are applied in place, only the data is reloaded -->
+    <form id="filter" class="row g-3 align-items-end">
       <div class="col-auto">
         <label for="start" class="form-label">Start Time</label>
-        <input type="datetime-local" class="form-control" name="start" id="start" value="{{ start_value|default('') }}">
+        <input type="datetime-local" step="1" class="form-control" name="start" id="start">
       </div>
       <div class="col-auto">
         <label for="end" class="form-label">End Time</label>
-        <input type="datetime-local" class="form-control" name="end" id="end" value="{{ end_value|default('') }}">
+        <input type="datetime-local" step="1" class="form-control" name="end" id="end">
       </div>
       <div class="col-auto">
         <button type="submit" class="btn">Filter</button>
       </div>
     </form>
-    <p class="text-muted">If left blank, data from the last 24 hours is displayed.</p>
+    <p class="text-muted">If left blank, data from the last 24 hours is displayed. <span id="status"></span></p>
     <!-- Summary Cards -->
-    <div class="row">
-      <div class="col-md-6">
-        <div class="summary-card">
-          <h3>Machine1 Summary</h3>
-          <p>Temperature - Avg: <strong>{{ m1_avg_temp }}</strong>, Min: <strong>{{ m1_min_temp }}</strong>, Max: <strong>{{ m1_max_temp }}</strong></p>
-          <p>Pressure - Avg: <strong>{{ m1_avg_press }}</strong>, Min: <strong>{{ m1_min_press }}</strong>, Max: <strong>{{ m1_max_press }}</strong></p>
-        </div>
-      </div>
-      <div class="col-md-6">
-        <div class="summary-card">
-          <h3>Machine2 Summary</h3>
-          <p>Temperature - Avg: <strong>{{ m2_avg_temp }}</strong>, Min: <strong>{{ m2_min_temp }}</strong>, Max: <strong>{{ m2_max_temp }}</strong></p>
-          <p>Pressure - Avg: <strong>{{ m2_avg_press }}</strong>, Min: <strong>{{ m2_min_press }}</strong>, Max: <strong>{{ m2_max_press }}</strong></p>
-        </div>
-      </div>
-    </div>
+    <div class="row" id="summaries"></div>
     <!-- Charts -->
     <div class="row my-4">
       <div class="col-md-12">
@@ -104,36 +197,246 @@ templates_dict = {
         </div>
       </div>
     </div>
+    <!-- Raw Records: fetched a page at a time, only once opened -->
+    <details id="rawRecords" class="my-4">
+      <summary><h4 class="d-inline">Raw Records</h4></summary>
+      <table class="table table-sm mt-3">
+        <thead><tr><th>ID</th><th>Machine</th><th>Timestamp</th><th>Temperature</th><th>Pressure</th></tr></thead>
+        <tbody id="rows"></tbody>
+      </table>
+      <button class="btn" id="prevPage">Previous</button>
+      <span id="pageLabel" class="mx-2"></span>
+      <button class="btn" id="nextPage">Next</button>
+    </details>
     <script>
-      const timeLabels = {{ time_labels|safe }};
-      const m1Temps = {{ m1_temps|safe }};
-      const m2Temps = {{ m2_temps|safe }};
-      const m1Press = {{ m1_press|safe }};
-      const m2Press = {{ m2_press|safe }};
-      const ctxTemp = document.getElementById('tempChart').getContext('2d');
-      new Chart(ctxTemp, {
-        type: 'line',
-        data: {
-          labels: timeLabels,
-          datasets: [
-            { label: 'Machine1 Temperature (°C)', data: m1Temps, borderColor: '#ffcc00', backgroundColor: 'rgba(255,204,0,0.1)', fill: true, tension: 0.2 },
-            { label: 'Machine2 Temperature (°C)', data: m2Temps, borderColor: '#00ccff', backgroundColor: 'rgba(0,204,255,0.1)', fill: true, tension: 0.2 }
-          ]
-        },
-        options: { responsive: true, scales: { x: { ticks: { color: '#e0e0e0' }, grid: { color: '#444' } }, y: { ticks: { color: '#e0e0e0' }, grid: { color: '#444' } } }, plugins: { legend: { labels: { color: '#ffcc00' } } } }
+      const palette = ['#ffcc00', '#00ccff', '#ff6600', '#66ff66', '#ff33cc', '#9966ff', '#ff3333', '#33ffcc'];
+      const chartOptions = { responsive: true, animation: false, spanGaps: true, scales: { x: { ticks: { color: '#e0e0e0' }, grid: { color: '#444' } }, y: { ticks: { color: '#e0e0e0' }, grid: { color: '#444' } } }, plugins: { legend: { labels: { color: '#ffcc00' } } } };
+      const tempChart = new Chart(document.getElementById('tempChart').getContext('2d'), { type: 'line', data: { labels: [], datasets: [] }, options: chartOptions });
+      const pressChart = new Chart(document.getElementById('pressChart').getContext('2d'), { type: 'line', data: { labels: [], datasets: [] }, options: chartOptions });
+      const rawRecords = document.getElementById('rawRecords');
+      let rowsPage = 0;
+      let rowsLoadedFor = null;
+
+      // Live mode (default 24h window): after one full load, new rows arrive as
+      // websocket deltas and are merged in by timestamp. The window is only
+      // reloaded when the feed signals that it cannot fill a gap.
+      const WS_URL = '{{ ws_url }}';
+      const LIVE_WINDOW_MS = 24 * 3600 * 1000;
+      const LIVE_BUCKET_MS = {{ live_bucket_seconds }} * 1000;
+      const FIELDS = [['Temperature', 'temperature'], ['Pressure', 'pressure']];
+      let live = null;
+      let loaded = null;
+
+      function windowParams() {
+        const params = new URLSearchParams();
+        const start = document.getElementById('start').value;
+        const end = document.getElementById('end').value;
+        if (start && end) { params.set('start', start); params.set('end', end); }
+        return params;
+      }
+
+      function datasets(data, field, unit) {
+        return data.series.map((s, i) => ({
+          label: `${s.machine} ${field} (${unit})`,
+          data: s.times.map((t, j) => ({ x: t, y: s[field][j] })),
+          borderColor: palette[i % palette.length], fill: false, tension: 0.2, pointRadius: 0
+        }));
+      }
+
+      function renderSummaries(data) {
+        const fields = [['Temperature', '°C'], ['Pressure', 'hPa']];
+        document.getElementById('summaries').innerHTML = data.series.map(s => `
+          <div class="col-md-6"><div class="summary-card"><h3>${s.machine} Summary</h3>
+          ${fields.map(([f, unit]) => { const st = s.stats[f]; return `<p>${f} (${unit}) - Avg: <strong>${st.avg}</strong>, Min: <strong>${st.min}</strong>, Max: <strong>${st.max}</strong>,
+             Std: <strong>${st.std}</strong>, P50: <strong>${st.p50 ?? '-'}</strong>, P95: <strong>${st.p95 ?? '-'}</strong></p>`; }).join('')}
+          </div></div>`).join('');
+      }
+
+      async function loadData() {
+        const status = document.getElementById('status');
+        status.textContent = 'Loading...';
+        // The browser revalidates with If-None-Match; an unchanged window costs a 304
+        const response = await fetch('/cyberpunk/data?' + windowParams());
+        if (!response.ok) { status.textContent = 'Failed to load sensor data (' + response.status + ')'; return; }
+        const data = await response.json();
+        status.textContent = `Showing ${data.start} to ${data.end}`;
+        renderSummaries(data);
+        for (const [chart, field, unit] of [[tempChart, 'temperature', '°C'], [pressChart, 'pressure', 'hPa']]) {
+          chart.data.labels = data.labels;
+          chart.data.datasets = datasets(data, field, unit);
+          chart.update();
+        }
+        startLive(data);
+      }
+
+      function isLiveWindow() { return !windowParams().has('start'); }
+
+      function utcStamp(ms) {
+        // Rows carry naive UTC timestamps: "YYYY-MM-DD HH:MM:SS"
+        return new Date(ms).toISOString().slice(0, 19).replace('T', ' ');
+      }
+
+      function bucketOf(t) {
+        const ms = Date.parse(t.replace(' ', 'T') + 'Z');
+        return utcStamp(ms - ms % LIVE_BUCKET_MS);
+      }
+
+      function addMachine(machine) {
+        const series = { machine, stats: {}, p: {}, buckets: {} };
+        for (const [f] of FIELDS) { series.p[f] = { p50: 0, p95: 0 }; series.buckets[f] = new Map(); }
+        loaded.series.push(series);
+        const i = loaded.series.length - 1;
+        for (const [chart, field, unit] of [[tempChart, 'Temperature', '°C'], [pressChart, 'Pressure', 'hPa']]) {
+          chart.data.datasets.push({ label: `${machine} ${field} (${unit})`, data: [], borderColor: palette[i % palette.length], fill: false, tension: 0.2, pointRadius: 0 });
+        }
+        return i;
+      }
+
+      function combine(buckets) {
+        // Chan et al.'s pairwise merge of (count, mean, m2, min, max) aggregates
+        const st = { count: 0, mean: 0, m2: 0, min: 0, max: 0 };
+        for (const b of buckets) {
+          if (!b.count) { continue; }
+          const count = st.count + b.count;
+          const delta = b.mean - st.mean;
+          st.m2 += b.m2 + delta * delta * st.count * b.count / count;
+          st.mean += delta * b.count / count;
+          st.min = st.count ? Math.min(st.min, b.min) : b.min;
+          st.max = st.count ? Math.max(st.max, b.max) : b.max;
+          st.count = count;
+        }
+        return st;
+      }
+
+      function upperBound(items, t, key) {
+        // First position whose timestamp is after t, so equal timestamps keep arrival order
+        let lo = 0, hi = items.length;
+        while (lo < hi) { const mid = (lo + hi) >> 1; if (key(items[mid]) <= t) { lo = mid + 1; } else { hi = mid; } }
+        return lo;
+      }
+
+      function applyRows(rows) {
+        const cutoff = utcStamp(Date.now() - LIVE_WINDOW_MS);
+        const labels = tempChart.data.labels;
+        for (const r of rows) {
+          live.lastId = Math.max(live.lastId, r.ID);
+          const t = String(r.Timestamp).replace('T', ' ').slice(0, 19);
+          if (t < cutoff) { continue; }
+          let i = loaded.series.findIndex(s => s.machine === r.MachineID);
+          if (i < 0) { i = addMachine(r.MachineID); }
+          // Late and same-second rows are merged in place rather than appended
+          const at = upperBound(labels, t, (label) => label);
+          if (labels[at - 1] !== t) { labels.splice(at, 0, t); }
+          for (const [f, key] of FIELDS) {
+            const value = r[f];
+            const chart = key === 'temperature' ? tempChart : pressChart;
+            const points = chart.data.datasets[i].data;
+            points.splice(upperBound(points, t, (p) => p.x), 0, { x: t, y: value });
+            if (value === null || value === undefined) { continue; }
+            // Welford update of the row's bucket
+            const buckets = loaded.series[i].buckets[f];
+            const start = bucketOf(t);
+            let b = buckets.get(start);
+            if (!b) { b = { count: 0, mean: 0, m2: 0, min: value, max: value }; buckets.set(start, b); }
+            b.count += 1;
+            const delta = value - b.mean;
+            b.mean += delta / b.count;
+            b.m2 += delta * (value - b.mean);
+            b.min = Math.min(b.min, value);
+            b.max = Math.max(b.max, value);
+          }
+        }
+        // Roll the window forward: drop points that fell out of the last 24 hours,
+        // and buckets once all of their rows have
+        const bucketCutoff = utcStamp(Date.parse(cutoff.replace(' ', 'T') + 'Z') - LIVE_BUCKET_MS);
+        while (labels.length && labels[0] < cutoff) { labels.shift(); }
+        for (const chart of [tempChart, pressChart]) {
+          for (const ds of chart.data.datasets) { while (ds.data.length && ds.data[0].x < cutoff) { ds.data.shift(); } }
+          chart.update('none');
+        }
+        for (const s of loaded.series) {
+          for (const [f] of FIELDS) {
+            for (const start of s.buckets[f].keys()) { if (start <= bucketCutoff) { s.buckets[f].delete(start); } }
+            const st = combine(s.buckets[f].values());
+            const round = (v) => Math.round(v * 100) / 100;
+            s.stats[f] = { avg: round(st.mean), min: round(st.min), max: round(st.max), std: round(st.count ? Math.sqrt(st.m2 / st.count) : 0), ...s.p[f], count: st.count };
+          }
+        }
+        renderSummaries(loaded);
+      }
+
+      function connectLive(lastId) {
+        const socket = new WebSocket(WS_URL + (lastId ? '?since=' + lastId : ''));
+        live = { socket, lastId };
+        socket.onmessage = (event) => {
+          if (!live || live.socket !== socket) { return; }
+          const message = JSON.parse(event.data);
+          // Too far behind to be sent the rows in between: reload the window
+          if (message.resync) { loadData(); } else { applyRows(message); }
+        };
+        socket.onclose = () => {
+          // Reconnect from the last delivered ID unless live mode was turned off
+          setTimeout(() => { if (live && live.socket === socket) { connectLive(live.lastId); } }, 2000);
+        };
+        document.getElementById('status').textContent += ' (live)';
+      }
+
+      function stopLive() {
+        if (live) { const socket = live.socket; live = null; socket.close(); }
+      }
+
+      function startLive(data) {
+        stopLive();
+        if (!isLiveWindow()) { return; }
+        // Percentiles cannot be updated incrementally; they keep the last load's values until the next resync
+        loaded = { series: data.series.map(s => ({
+          machine: s.machine, stats: s.stats,
+          p: Object.fromEntries(FIELDS.map(([f]) => [f, { p50: s.stats[f].p50, p95: s.stats[f].p95 }])),
+          buckets: Object.fromEntries(FIELDS.map(([f]) => [f, new Map((s.buckets ? s.buckets[f] : []).map(([start, count, mean, m2, min, max]) => [start, { count, mean, m2, min, max }]))])),
+        })) };
+        connectLive(data.last_id);
+      }
+
+      async function loadRows() {
+        const params = windowParams();
+        params.set('page', rowsPage);
+        const response = await fetch('/cyberpunk/rows?' + params);
+        if (!response.ok) { return; }
+        const data = await response.json();
+        document.getElementById('rows').innerHTML = data.rows.map(r =>
+          `<tr><td>${r.ID}</td><td>${r.MachineID}</td><td>${r.Timestamp}</td><td>${r.Temperature}</td><td>${r.Pressure}</td></tr>`).join('');
+        document.getElementById('pageLabel').textContent = `Page ${data.page + 1}`;
+        document.getElementById('prevPage').disabled = data.page === 0;
+        document.getElementById('nextPage').disabled = !data.has_more;
+        rowsLoadedFor = windowParams().toString();
+      }
+
+      function refresh() {
+        loadData();
+        rowsPage = 0;
+        rowsLoadedFor = null;
+        if (rawRecords.open) { loadRows(); }
+      }
+
+      rawRecords.addEventListener('toggle', () => { if (rawRecords.open && rowsLoadedFor !== windowParams().toString()) { loadRows(); } });
+      document.getElementById('prevPage').addEventListener('click', () => { rowsPage = Math.max(rowsPage - 1, 0); loadRows(); });
+      document.getElementById('nextPage').addEventListener('click', () => { rowsPage += 1; loadRows(); });
+      document.getElementById('filter').addEventListener('submit', (event) => {
+        event.preventDefault();
+        history.pushState(null, '', '/cyberpunk?' + windowParams());
+        refresh();
       });
-      const ctxPress = document.getElementById('pressChart').getContext('2d');
-      new Chart(ctxPress, {
-        type: 'line',
-        data: {
-          labels: timeLabels,
-          datasets: [
-            { label: 'Machine1 Pressure (hPa)', data: m1Press, borderColor: '#ff6600', backgroundColor: 'rgba(255,102,0,0.1)', fill: true, tension: 0.2 },
-            { label: 'Machine2 Pressure (hPa)', data: m2Press, borderColor: '#66ff66', backgroundColor: 'rgba(102,255,102,0.1)', fill: true, tension: 0.2 }
-          ]
-        },
-        options: { responsive: true, scales: { x: { ticks: { color: '#e0e0e0' }, grid: { color: '#444' } }, y: { ticks: { color: '#e0e0e0' }, grid: { color: '#444' } } }, plugins: { legend: { labels: { color: '#ffcc00' } } } }
+      window.addEventListener('popstate', () => {
+        const params = new URLSearchParams(location.search);
+        document.getElementById('start').value = params.get('start') || '';
+        document.getElementById('end').value = params.get('end') || '';
+        refresh();
       });
+
+      const initial = new URLSearchParams(location.search);
+      document.getElementById('start').value = initial.get('start') || '';
+      document.getElementById('end').value = initial.get('end') || '';
+      refresh();
     </script>
     {% endblock %}
     """
@@ -146,104 +449,176 @@ def render_template(template_name: str, context: dict):
     return template.render(**context)
 
 # ---------------------------------------------------------------------------
-# Cyberpunk Dashboard Endpoint
+# Series Statistics (columnar, vectorized with NumPy)
 # ---------------------------------------------------------------------------
-@app.get("/cyberpunk", response_class=HTMLResponse)
-def cyberpunk_dashboard(request: Request, start: str = None, end: str = None):
+STAT_FIELDS = ("Temperature", "Pressure")
+def to_columns(sensor_data):
+    """Turn the API's list of row dicts into NumPy columns in a single pass."""
+    if not sensor_data:
+        return np.array([], dtype=object), np.array([], dtype=object), {f: np.array([]) for f in STAT_FIELDS}
+    keys = ("MachineID", "Timestamp") + STAT_FIELDS
+    columns = list(zip(*([r.get(k) for k in keys] for r in sensor_data)))
+    machine_ids = np.asarray(columns[0], dtype=object)
+    times = np.asarray(columns[1], dtype=object)
+    # Missing readings become NaN and are left out of the statistics
+    values = {f: np.array([np.nan if v is None else v for v in col], dtype=float) for f, col in zip(STAT_FIELDS, columns[2:])}
+    return machine_ids, times, values
+
+def summarize(sensor_data, stats):
     """
-    Displays a dashboard for sensor data fetched via an API.
-    Date format must be "YYYY-MM-DD HH:MM:SS".
+    Group rows by MachineID (any number of machines) and return per machine its
+    chart series and statistics, plus the sorted union of timestamps.
+    The series come from `sensor_data`; the statistics are the sensors API's
+    `/sensors/stats` result over every row of the window, since downsampled
+    series keep the peaks on purpose and would bias them.
+    """
+    machine_ids, times, values = to_columns(sensor_data)
+    machines = np.union1d(machine_ids.astype(str), np.array(list(stats), dtype=str))
+    codes = np.searchsorted(machines, machine_ids.astype(str))
+
+    # Row indices per machine, in the order the API returned them
+    order = np.argsort(codes, kind="stable")
+    groups = np.split(order, np.cumsum(np.bincount(codes, minlength=len(machines)))[:-1])
+
+    summary = []
+    for g, machine in enumerate(machines):
+        idx = groups[g]
+        summary.append({
+            "id": machine,
+            "times": times[idx].tolist(),
+            "temperature": [None if np.isnan(v) else v for v in values["Temperature"][idx].tolist()],
+            "pressure": [None if np.isnan(v) else v for v in values["Pressure"][idx].tolist()],
+            "stats": {f: round_stats(stats.get(machine, {}).get(f)) for f in STAT_FIELDS},
+        })
+    labels = np.unique(times.astype(str)).tolist() if len(times) else []
+    return summary, labels
+
+def round_stats(record):
+    """One field's statistics for display; a field without readings reports zeros."""
+    if record is None:
+        return {"avg": 0.0, "min": 0.0, "max": 0.0, "std": 0.0, "p50": 0.0, "p95": 0.0, "count": 0}
+    return {name: value if name == "count" or value is None else round(float(value), 2)
+            for name, value in record.items()}
+
+# ---------------------------------------------------------------------------
+# Cyberpunk Dashboard Endpoints
+# ---------------------------------------------------------------------------
+# The page itself holds no data, so it is rendered once and cached by browsers;
+# charts and the raw table are loaded from the JSON endpoints below.
+SHELL_HTML = render_template("cyberpunk.html", {"title": "Cyberpunk Dashboard", "ws_url": WS_URL,
+                                                "live_bucket_seconds": LIVE_BUCKET_SECONDS})
+SHELL_ETAG = '"' + hashlib.sha1(SHELL_HTML.encode()).hexdigest() + '"'
+
+def parse_window(start: str, end: str):
+    """
+    Resolve the requested window to ("YYYY-MM-DD HH:MM:SS", ...) strings.
+    Defaults to the last 24 hours; raises ValueError on a bad format.
     """
     # Default to last 24 hours if no start or end provided.
     if not start or not end:
-        end_dt = datetime.now()
+        # Aligned to CACHE_TTL so every display in the same interval hits one cache entry
+        # Rows are stamped in UTC, so the window is too
+        now = datetime.utcnow().replace(microsecond=0)
+        end_dt = now - timedelta(seconds=int(now.timestamp()) % CACHE_TTL)
         start_dt = end_dt - timedelta(hours=24)
     else:
-        # Replace any 'T' with a space so the format matches "YYYY-MM-DD HH:MM:SS"
+        # Replace any 'T' with a space so the format matches "YYYY-MM-DD HH:MM:SS";
+        # datetime-local inputs may leave out the seconds
         start = start.replace("T", " ")
         end = end.replace("T", " ")
-        try:
-            start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
-            end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            return HTMLResponse(content="<h1>Invalid date format. Use YYYY-MM-DD HH:MM:SS</h1>", status_code=400)
-
-    start_str = start_dt.strftime("%Y-%m-%d %H:%M:%S")
-    end_str = end_dt.strftime("%Y-%m-%d %H:%M:%S")
-
-    # -----------------------------------------------------------------------
-    # Fetch sensor data from the API using proper headers and parameters.
-    # -----------------------------------------------------------------------
+        if len(start) == 16:
+            start += ":00"
+        if len(end) == 16:
+            end += ":00"
+        start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
+        end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
+    return start_dt.strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S")
+
+def etag_json_response(request: Request, payload):
+    """Compact JSON with a content hash ETag; answers 304 when the client already has it."""
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.get("/cyberpunk", response_class=HTMLResponse)
+async def cyberpunk_dashboard(request: Request):
+    """
+    Serves the dashboard shell. The selected window lives in the query string
+    and is read by the page's script, so every window shares this response.
+    """
+    headers = {"ETag": SHELL_ETAG, "Cache-Control": "public, max-age=3600"}
+    if SHELL_ETAG in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return HTMLResponse(content=SHELL_HTML, headers=headers)
+
+@app.get("/cyberpunk/data")
+async def cyberpunk_data(request: Request, start: str = None, end: str = None):
+    """
+    Chart series and per-machine statistics for a window.
+    Date format must be "YYYY-MM-DD HH:MM:SS".
+    """
     try:
-        headers = {"X-API-KEY": API_KEY}
-        params = {"start": start_str, "end": end_str}
-        api_response = requests.get(API_URL, headers=headers, params=params)
-        api_response.raise_for_status()
-        sensor_data = api_response.json()
+        start_str, end_str = parse_window(start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD HH:MM:SS")
 
-        # If the response is a string, attempt to parse it.
-        if isinstance(sensor_data, str):
-            sensor_data = json.loads(sensor_data)
-        
-        # If the sensor API returns a dict with a "data" key, use that.
-        if isinstance(sensor_data, dict) and "data" in sensor_data:
-            sensor_data = sensor_data["data"]
+    # Only the default window goes live; it also needs the statistics per bucket
+    live = not start or not end
+    try:
+        # Charts get at most MAX_POINTS per machine; the statistics are computed upstream over every row
+        sensor_data, stats = await asyncio.gather(
+            fetch_sensor_data(start_str, end_str),
+            fetch_sensor_stats(start_str, end_str, bucket=LIVE_BUCKET if live else None),
+        )
     except Exception as e:
-        return HTMLResponse(content=f"<h1>Error: Failed to retrieve sensor data: {str(e)}</h1>", status_code=500)
+        raise HTTPException(status_code=502, detail=f"Failed to retrieve sensor data: {str(e)}")
 
     # Ensure sensor_data is a list.
-    if not isinstance(sensor_data, list):
-        return HTMLResponse(content="<h1>Error: Unexpected sensor data format</h1>", status_code=500)
-
-    # Split sensor data by MachineID.
-    rows_m1 = [record for record in sensor_data if record.get("MachineID") == "Machine1"]
-    rows_m2 = [record for record in sensor_data if record.get("MachineID") == "Machine2"]
-
-    def process_rows(rows):
-        data, times, temps, press = [], [], [], []
-        for r in rows:
-            record = {
-                "ID": r.get("ID"),
-                "MachineID": r.get("MachineID"),
-                "Timestamp": r.get("Timestamp"),
-                "Temperature": float(r.get("Temperature")),
-                "Pressure": float(r.get("Pressure"))
+    if not isinstance(sensor_data, list) or not isinstance(stats, dict) or "stats" not in stats:
+        raise HTTPException(status_code=502, detail="Unexpected sensor data format")
+
+    machines, time_labels = summarize(sensor_data, stats["stats"])
+    buckets = stats.get("buckets", {}) if live else None
+    return etag_json_response(request, {
+        "start": start_str,
+        "end": end_str,
+        # Resume position for the live websocket feed
+        "last_id": stats.get("last_id", 0),
+        "labels": time_labels,
+        "series": [
+            {
+                "machine": m["id"],
+                "times": m["times"],
+                "temperature": m["temperature"],
+                "pressure": m["pressure"],
+                "stats": m["stats"],
+                **({"buckets": {f: buckets.get(m["id"], {}).get(f, []) for f in STAT_FIELDS}} if buckets is not None else {}),
             }
-            data.append(record)
-            times.append(record["Timestamp"])
-            temps.append(record["Temperature"])
-            press.append(record["Pressure"])
-        return data, times, temps, press
-
-    m1_data, m1_times, m1_temps, m1_press = process_rows(rows_m1)
-    m2_data, m2_times, m2_temps, m2_press = process_rows(rows_m2)
-    time_labels = m1_times if m1_times else m2_times
-
-    def compute_stats(values):
-        if values:
-            return round(statistics.mean(values), 2), round(min(values), 2), round(max(values), 2)
-        return 0, 0, 0
-
-    m1_avg_temp, m1_min_temp, m1_max_temp = compute_stats(m1_temps)
-    m1_avg_press, m1_min_press, m1_max_press = compute_stats(m1_press)
-    m2_avg_temp, m2_min_temp, m2_max_temp = compute_stats(m2_temps)
-    m2_avg_press, m2_min_press, m2_max_press = compute_stats(m2_press)
-
-    context = {
-        "title": "Cyberpunk Dashboard",
-        "start_value": start_str,
-        "end_value": end_str,
-        "machine1_rows": m1_data,
-        "machine2_rows": m2_data,
-        "time_labels": time_labels,
-        "m1_temps": m1_temps,
-        "m2_temps": m2_temps,
-        "m1_press": m1_press,
-        "m2_press": m2_press,
-        "m1_avg_temp": m1_avg_temp, "m1_min_temp": m1_min_temp, "m1_max_temp": m1_max_temp,
-        "m1_avg_press": m1_avg_press, "m1_min_press": m1_min_press, "m1_max_press": m1_max_press,
-        "m2_avg_temp": m2_avg_temp, "m2_min_temp": m2_min_temp, "m2_max_temp": m2_max_temp,
-        "m2_avg_press": m2_avg_press, "m2_min_press": m2_min_press, "m2_max_press": m2_max_press,
-    }
-
-    return HTMLResponse(content=render_template("cyberpunk.html", context))
+            for m in machines
+        ],
+    })
+
+@app.get("/cyberpunk/rows")
+async def cyberpunk_rows(request: Request, start: str = None, end: str = None, page: int = 0):
+    """One page of raw records for the window, newest first."""
+    try:
+        start_str, end_str = parse_window(start, end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD HH:MM:SS")
+    page = max(page, 0)
+
+    try:
+        # One extra row tells whether there is a next page
+        rows = await fetch_sensor_data(start_str, end_str, max_points=None,
+                                       limit=ROWS_PAGE_SIZE + 1, offset=page * ROWS_PAGE_SIZE)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to retrieve sensor data: {str(e)}")
+
+    return etag_json_response(request, {
+        "page": page,
+        "has_more": len(rows) > ROWS_PAGE_SIZE,
+        "rows": rows[:ROWS_PAGE_SIZE],
+    })
@@ -1,10 +1,17 @@
 import os
-import json
+import math
 import logging
 import time
+import signal
+import socket
+import threading
 import paho.mqtt.client as mqtt
 import pyodbc
-from datetime import datetime
+from writer import BatchWriter
+from pipeline import IngestPipeline, report_loop, serve_metrics
+from sharding import ShardCoordinator
+from payload import decode
+from registry import load_registry
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -13,7 +20,18 @@ logger = logging.getLogger("mqtt_client")
 # MQTT settings
 MQTT_BROKER = os.getenv("MQTT_BROKER", "mqtt-broker")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
-TOPICS = [("machine1/sensor", 0), ("machine2/sensor", 0)]
+# Must be unique per instance: the broker disconnects the older of two clients sharing an ID
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID") or f"mqtt_client-{socket.gethostname()}-{os.getpid()}"
+
+# Sharding across instances (see sharding.py): "all" subscribes to every
+# machine, "static" takes the machines hashing to SHARD_INDEX of SHARD_COUNT,
+# "dynamic" splits machines among the live instances of SHARD_GROUP and
+# rebalances REBALANCE_DELAY seconds after an instance joins or leaves.
+SHARD_MODE = os.getenv("SHARD_MODE", "all")
+SHARD_GROUP = os.getenv("SHARD_GROUP", "sensordb")
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))
+REBALANCE_DELAY = float(os.getenv("REBALANCE_DELAY", "2.0"))
 
 # Database connection parameters
 DB_SERVER = os.getenv("DB_SERVER", "mssql")
@@ -22,6 +40,26 @@ DB_USERNAME = os.getenv("DB_USERNAME", "sa")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "YourStrong!Passw0rd")
 DB_DRIVER = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")
 
+# Write-behind settings: a batch is flushed on whichever limit is reached first
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "500"))
+BATCH_MAX_LATENCY = float(os.getenv("BATCH_MAX_LATENCY", "1.0"))
+BATCH_MAX_PENDING = int(os.getenv("BATCH_MAX_PENDING", "100000"))
+
+# Ingest pipeline: raw messages wait in INGEST_QUEUE_SIZE slots (split over the
+# parse workers) and OVERFLOW_POLICY (block, drop-oldest or spill) decides what
+# happens when they are full. "spill" writes the overflow to SPILL_DIR.
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "4"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+OVERFLOW_POLICY = os.getenv("OVERFLOW_POLICY", "block")
+SPILL_DIR = os.getenv("SPILL_DIR", "/tmp/mqtt-spill")
+SPILL_MAX_BYTES = int(os.getenv("SPILL_MAX_BYTES", str(1 << 30)))
+# Seconds between throughput log lines; METRICS_PORT > 0 also serves them as JSON on /metrics
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", "30"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Maps each registered machine's topic to its ID; the registry file is MACHINE_REGISTRY
+TOPIC_MACHINES = {machine["topic"]: machine["id"] for machine in load_registry()[1]}
+
 def get_db_connection():
     conn_str = (
         f"DRIVER={DB_DRIVER};"
@@ -43,53 +81,103 @@ def get_db_connection():
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
-        logger.info("Connected to MQTT broker")
-        client.subscribe(TOPICS)
+        logger.info(f"Connected to MQTT broker as {MQTT_CLIENT_ID}")
+        userdata["shards"].on_connect()
     else:
         logger.error(f"Failed to connect to MQTT broker with code {rc}")
 
 def on_message(client, userdata, msg):
-    try:
-        payload = msg.payload.decode()
-        data = json.loads(payload)
+    # Network thread: hand the raw message to the pipeline and get back to the socket
+    userdata["pipeline"].submit(msg.topic, msg.payload)
 
-        # Determine Machine ID from topic name
-        machine_id = "Machine1" if msg.topic == "machine1/sensor" else "Machine2"
-        timestamp_str = data.get("timestamp")  # Example: '2025-03-28T05:46:57.513491'
-        temperature = data.get("temperature")
-        pressure = data.get("pressure")
+def parse_message(topic, payload):
+    """Parse worker stage: raw MQTT message -> SensorData rows; an empty list discards it."""
+    # Determine Machine ID from topic name
+    machine_id = TOPIC_MACHINES.get(topic)
+    if machine_id is None:
+        logger.warning(f"Ignoring message on unregistered topic {topic}")
+        return []
 
-        logger.info(f"Received data from {machine_id}: {data}")
+    # JSON samples and binary batches (see gateway/payload.py) both arrive here
+    try:
+        tags, samples = decode(payload)
+    except (TypeError, ValueError) as e:
+        logger.error(f"Undecodable payload on {topic}: {e}")
+        return []
+    logger.debug(f"Received {len(samples)} samples from {machine_id}")
 
-        # Convert timestamp to SQL Server datetime format
-        try:
-            timestamp = datetime.strptime(timestamp_str, "%Y-%m-%dT%H:%M:%S.%f").strftime("%Y-%m-%d %H:%M:%S")
-        except ValueError as e:
-            logger.error(f"Timestamp conversion error: {e}")
-            return
-
-        # Insert data into the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        sql = """
-            INSERT INTO SensorData (MachineID, Timestamp, Temperature, Pressure)
-            VALUES (?, ?, ?, ?)
-        """
-        cursor.execute(sql, machine_id, timestamp, temperature, pressure)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        logger.info("Data inserted into database")
-
-    except Exception as e:
-        logger.error(f"Error processing message: {e}")
+    # Position of each SensorData column in a sample; timestamp comes first
+    columns = [tags.index(tag) + 1 if tag in tags else None for tag in ("temperature", "pressure")]
+    rows = []
+    for sample in samples:
+        # Non-numeric values are rejected here instead of failing a whole batch insert
+        temperature, pressure = (None if i is None or sample[i] is None else float(sample[i]) for i in columns)
+        # So are NaN and +-Infinity, which JSON and float fields carry but SQL Server refuses
+        if not all(math.isfinite(value) for value in (temperature, pressure) if value is not None):
+            logger.warning(f"Dropping sample with a non-finite value from {machine_id}: {sample}")
+            continue
+        # Truncate to whole seconds to match the SQL Server DATETIME column
+        rows.append((machine_id, sample[0].replace(microsecond=0), temperature, pressure))
+    return rows
 
 def main():
-    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, "mqtt_client")
+    writer = BatchWriter(
+        get_db_connection,
+        batch_size=BATCH_SIZE,
+        max_latency=BATCH_MAX_LATENCY,
+        max_pending=BATCH_MAX_PENDING,
+        # Only drop-oldest may lose rows at the writer; otherwise a full writer
+        # stalls the parse workers and the ingest queues absorb (or spill) the backlog
+        overflow="drop-oldest" if OVERFLOW_POLICY == "drop-oldest" else "block",
+    )
+    pipeline = IngestPipeline(
+        parse_message,
+        writer,
+        workers=PARSE_WORKERS,
+        queue_size=INGEST_QUEUE_SIZE,
+        overflow=OVERFLOW_POLICY,
+        spill_dir=SPILL_DIR,
+        spill_max_bytes=SPILL_MAX_BYTES,
+    )
+    pipeline.start()
+
+    stop_reporting = threading.Event()
+    threading.Thread(target=report_loop, args=(pipeline, STATS_INTERVAL, stop_reporting), daemon=True).start()
+    if METRICS_PORT:
+        serve_metrics(pipeline, METRICS_PORT)
+
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, MQTT_CLIENT_ID)
+    shards = ShardCoordinator(
+        client,
+        TOPIC_MACHINES,
+        MQTT_CLIENT_ID,
+        mode=SHARD_MODE,
+        group=SHARD_GROUP,
+        shard_count=SHARD_COUNT,
+        shard_index=SHARD_INDEX,
+        rebalance_delay=REBALANCE_DELAY,
+    )
+    client.user_data_set({"pipeline": pipeline, "shards": shards})
     client.on_connect = on_connect
     client.on_message = on_message
-    client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    client.loop_forever()
+
+    # docker stop sends SIGTERM; hand our machines to the other instances and
+    # leave loop_forever so pending rows get drained
+    signal.signal(signal.SIGTERM, lambda signum, frame: shards.leave())
+
+    try:
+        client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        client.loop_forever()
+    except KeyboardInterrupt:
+        client.disconnect()
+    finally:
+        logger.info("Draining queued messages and pending rows before shutdown...")
+        pipeline.stop()
+        stop_reporting.set()
+        stats = pipeline.stats()
+        logger.info(f"Pipeline stopped: {stats['received']} messages received, {stats['parse']['parsed']} parsed, "
+                    f"{writer.rows_written} rows written, {stats['queue']['dropped'] + writer.rows_dropped} dropped, "
+                    f"{writer.rows_rejected} rejected")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import zlib
+import struct
+import logging
+import threading
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("mqtt_client.pipeline")
+
+OVERFLOW_POLICIES = ("block", "drop-oldest", "spill")
+
+
+class SpillFile:
+    """
+    Overflow file of (topic, payload) records, read back in the order they
+    were written. Once everything has been read the file is truncated, so it
+    only grows while a backlog exists. It is scratch space, not persistence:
+    the file is emptied when the process starts.
+    """
+
+    RECORD = struct.Struct("<HI")  # topic length, payload length
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._file = open(path, "w+b")
+        self._read_pos = 0
+        self._write_pos = 0
+        self.count = 0
+
+    def append(self, topic, payload):
+        """Returns False when the file is at `max_bytes`."""
+        topic_bytes = topic.encode("utf-8")
+        size = self.RECORD.size + len(topic_bytes) + len(payload)
+        if self._write_pos + size > self.max_bytes:
+            return False
+        self._file.seek(self._write_pos)
+        self._file.write(self.RECORD.pack(len(topic_bytes), len(payload)) + topic_bytes + payload)
+        self._write_pos += size
+        self.count += 1
+        return True
+
+    def pop(self):
+        self._file.seek(self._read_pos)
+        topic_len, payload_len = self.RECORD.unpack(self._file.read(self.RECORD.size))
+        topic = self._file.read(topic_len).decode("utf-8")
+        payload = self._file.read(payload_len)
+        self._read_pos += self.RECORD.size + topic_len + payload_len
+        self.count -= 1
+        if not self.count:
+            self._file.seek(0)
+            self._file.truncate()
+            self._read_pos = self._write_pos = 0
+        return topic, payload
+
+    @property
+    def bytes(self):
+        return self._write_pos - self._read_pos
+
+    def close(self):
+        self._file.close()
+        os.remove(self.path)
+
+
+class MessageQueue:
+    """
+    Bounded FIFO of raw (topic, payload) messages in front of one parse worker.
+
+    When `maxsize` messages are waiting, `put()` applies the overflow policy:
+      block        wait for room; paho stops reading the socket meanwhile,
+                   which pushes back on the broker (long stalls can trip the
+                   keepalive and cost the connection)
+      drop-oldest  discard the oldest waiting message
+      spill        append to a SpillFile; while spilled messages exist new
+                   ones go there too, so order is kept. Drops the newest
+                   message only once the spill file is full as well.
+    After `close()`, `get()` drains what is left and then returns None.
+    """
+
+    def __init__(self, maxsize, policy="block", spill_path=None, spill_max_bytes=1 << 30):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}, use one of {', '.join(OVERFLOW_POLICIES)}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = collections.deque()
+        self._spill = SpillFile(spill_path, spill_max_bytes) if policy == "spill" else None
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self.received = 0
+        self.enqueued = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.blocked_seconds = 0.0
+
+    def put(self, topic, payload):
+        with self._cond:
+            self.received += 1
+            if self._spill is not None and (self._spill.count or len(self._items) >= self.maxsize):
+                if self._spill.append(topic, payload):
+                    self.spilled += 1
+                    self.enqueued += 1
+                else:
+                    self.dropped += 1
+                self._cond.notify_all()
+                return
+            if len(self._items) >= self.maxsize:
+                if self.policy == "drop-oldest":
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    started = time.monotonic()
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    self.blocked_seconds += time.monotonic() - started
+            self._items.append((topic, payload))
+            self.enqueued += 1
+            self._cond.notify_all()
+
+    def get(self):
+        with self._cond:
+            while not self._items and not (self._spill is not None and self._spill.count):
+                if self._closed:
+                    return None
+                self._cond.wait()
+            # Memory always holds the older messages; the spill file continues after them
+            item = self._items.popleft() if self._items else self._spill.pop()
+            self._cond.notify_all()
+            return item
+
+    def depth(self):
+        with self._cond:
+            return len(self._items) + (self._spill.count if self._spill is not None else 0)
+
+    def spill_bytes(self):
+        with self._cond:
+            return self._spill.bytes if self._spill is not None else 0
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def discard_spill(self):
+        if self._spill is not None:
+            self._spill.close()
+
+
+class ParseWorker(threading.Thread):
+    """
+    Turns raw messages from its queue into rows and hands them to the writer
+    stage. `parse` returns the rows of one message (a batched payload carries
+    several); an empty list discards it.
+    """
+
+    def __init__(self, index, queue, parse, sink):
+        super().__init__(name=f"parse-worker-{index}", daemon=True)
+        self.queue = queue
+        self.parse = parse
+        self.sink = sink
+        self.parsed = 0
+        self.rejected = 0
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            try:
+                rows = self.parse(*item)
+            except Exception as e:
+                logger.error(f"Error processing message on {item[0]}: {e}")
+                rows = None
+            if not rows:
+                self.rejected += 1
+                continue
+            for row in rows:
+                self.sink(row)
+            self.parsed += len(rows)
+
+
+class IngestPipeline:
+    """
+    network thread -> MessageQueue -> ParseWorker -> BatchWriter.
+
+    `submit()` is all the MQTT callback does. Each worker owns one queue and
+    a topic always hashes to the same worker, so the samples of one machine
+    are parsed and handed to the writer in arrival order. A full writer
+    blocks the workers (unless it drops), which fills the queues, which
+    triggers their overflow policy: backpressure runs from the database all
+    the way back to the broker.
+    """
+
+    def __init__(self, parse, writer, workers=4, queue_size=10000, overflow="block",
+                 spill_dir="/tmp/mqtt-spill", spill_max_bytes=1 << 30):
+        if overflow == "spill":
+            os.makedirs(spill_dir, exist_ok=True)
+        self.writer = writer
+        self.queues = [
+            MessageQueue(
+                max(queue_size // workers, 1),
+                policy=overflow,
+                spill_path=os.path.join(spill_dir, f"worker-{i}.spill"),
+                spill_max_bytes=spill_max_bytes // workers,
+            )
+            for i in range(workers)
+        ]
+        self.workers = [ParseWorker(i, queue, parse, writer.submit) for i, queue in enumerate(self.queues)]
+        self.started = time.monotonic()
+
+    def start(self):
+        self.writer.start()
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, topic, payload):
+        self.queues[zlib.crc32(topic.encode("utf-8")) % len(self.queues)].put(topic, payload)
+
+    def stop(self, timeout=30):
+        """Drain the queues through the workers, then drain the writer."""
+        deadline = time.monotonic() + timeout
+        for queue in self.queues:
+            queue.close()
+        for worker in self.workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+        self.writer.stop(max(deadline - time.monotonic(), 1))
+        for queue in self.queues:
+            queue.discard_spill()
+
+    def stats(self):
+        """Cumulative counters and current depth of every stage."""
+        return {
+            "uptime_s": round(time.monotonic() - self.started, 1),
+            "received": sum(q.received for q in self.queues),
+            "queue": {
+                "depth": sum(q.depth() for q in self.queues),
+                "capacity": sum(q.maxsize for q in self.queues),
+                "policy": self.queues[0].policy,
+                "dropped": sum(q.dropped for q in self.queues),
+                "spilled": sum(q.spilled for q in self.queues),
+                "spill_bytes": sum(q.spill_bytes() for q in self.queues),
+                "blocked_s": round(sum(q.blocked_seconds for q in self.queues), 3),
+                "per_worker": [q.depth() for q in self.queues],
+            },
+            "parse": {
+                "workers": len(self.workers),
+                "parsed": sum(w.parsed for w in self.workers),
+                "rejected": sum(w.rejected for w in self.workers),
+            },
+            "writer": {
+                "pending": self.writer.pending,
+                "written": self.writer.rows_written,
+                "dropped": self.writer.rows_dropped,
+                "rejected": self.writer.rows_rejected,
+            },
+        }
+
+
+def report_loop(pipeline, interval, stop_event):
+    """Log per-stage throughput over each interval and the current queue depths."""
+    last, last_at = pipeline.stats(), time.monotonic()
+    while not stop_event.wait(interval):
+        now, now_at = pipeline.stats(), time.monotonic()
+        elapsed = max(now_at - last_at, 1e-9)
+        logger.info(
+            f"Ingest: received {(now['received'] - last['received']) / elapsed:.1f}/s, "
+            f"parsed {(now['parse']['parsed'] - last['parse']['parsed']) / elapsed:.1f}/s, "
+            f"written {(now['writer']['written'] - last['writer']['written']) / elapsed:.1f}/s; "
+            f"queue {now['queue']['depth']}/{now['queue']['capacity']} "
+            f"(spilled {now['queue']['spill_bytes']} bytes), writer pending {now['writer']['pending']}, "
+            f"dropped {now['queue']['dropped'] + now['writer']['dropped']}"
+        )
+        last, last_at = now, now_at
+
+
+def serve_metrics(pipeline, port):
+    """Serve pipeline.stats() as JSON on GET /metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = json.dumps(pipeline.stats()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Pipeline metrics on http://0.0.0.0:{port}/metrics")
+    return server
@@ -0,0 +1,151 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger("mqtt_client.sharding")
+
+SHARD_MODES = ("all", "static", "dynamic")
+
+
+def stable_hash(text):
+    # Python's hash() is salted per process; shards must agree across processes and hosts
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def rendezvous_owner(machine_id, members):
+    """Highest-random-weight owner: a member leaving only moves the machines it owned."""
+    return max(members, key=lambda member: stable_hash(f"{member}/{machine_id}"))
+
+
+class ShardCoordinator:
+    """
+    Decides which machine topics this mqtt-client instance subscribes to.
+
+    A machine is only ever owned by one instance, and one instance parses
+    and writes a machine's samples in order, so per-machine ordering holds
+    however many instances run. (Shared subscriptions would spread one
+    machine's messages over several instances and lose that.)
+
+      all      every registered topic; a single instance
+      static   machines with stable_hash(MachineID) % shard_count == shard_index
+      dynamic  instances announce themselves with a retained presence message
+               under ingest/members/<group>/, cleared by their last will when
+               they disconnect, and split the machines by rendezvous hashing.
+               A membership change is applied after `rebalance_delay` seconds
+               of quiet, so a rolling restart rebalances once, and only the
+               machines of the instance that joined or left change owner.
+
+    While a machine changes owner, the old owner may still be writing what
+    it had queued when the new owner starts. With QoS 0 a handful of
+    messages can also be lost in the hand-over window.
+    """
+
+    def __init__(self, client, topic_machines, client_id, mode="all", group="sensordb",
+                 shard_count=1, shard_index=0, rebalance_delay=2.0):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode {mode!r}, use one of {', '.join(SHARD_MODES)}")
+        if mode == "static" and not 0 <= shard_index < shard_count:
+            raise ValueError(f"SHARD_INDEX must be in 0..{shard_count - 1}")
+        self.client = client
+        self.topic_machines = topic_machines
+        self.client_id = client_id
+        self.mode = mode
+        self.shard_count = shard_count
+        self.shard_index = shard_index
+        self.rebalance_delay = rebalance_delay
+
+        self.members_filter = f"ingest/members/{group}/+"
+        self.presence_topic = f"ingest/members/{group}/{client_id}"
+        self.members = set()
+        self.subscribed = set()
+        self.rebalances = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._leave_mid = None
+
+        if mode == "dynamic":
+            # Broker clears our presence if we vanish without saying goodbye
+            client.will_set(self.presence_topic, b"", qos=1, retain=True)
+            client.message_callback_add(self.members_filter, self.on_presence)
+            client.on_publish = self._on_publish
+
+    def on_connect(self):
+        """(Re)subscribe after every connect; clean sessions forget subscriptions."""
+        with self._lock:
+            self.subscribed = set()
+            if self.mode != "dynamic":
+                self._apply(self._assign(None))
+                return
+            self.members = set()
+        self.client.subscribe(self.members_filter, qos=1)
+        presence = json.dumps({"client_id": self.client_id, "since": time.time()})
+        self.client.publish(self.presence_topic, presence, qos=1, retain=True)
+
+    def on_presence(self, client, userdata, msg):
+        member = msg.topic.rsplit("/", 1)[-1]
+        with self._lock:
+            if msg.payload:
+                self.members.add(member)
+            else:
+                self.members.discard(member)
+            # Debounce: several joins/leaves in a row become one rebalance
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.rebalance_delay, self._rebalance)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def leave(self, timeout=5.0):
+        """
+        Disconnect cleanly. In dynamic mode the presence message is withdrawn
+        first (a clean disconnect does not fire the last will), so peers take
+        over our machines right away; the disconnect follows once the broker
+        acknowledges, or after `timeout` seconds. Safe to call from a signal
+        handler interrupting loop_forever().
+        """
+        if self.mode != "dynamic" or not self.client.is_connected():
+            self.client.disconnect()
+            return
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self._leave_mid = self.client.publish(self.presence_topic, b"", qos=1, retain=True).mid
+        fallback = threading.Timer(timeout, self.client.disconnect)
+        fallback.daemon = True
+        fallback.start()
+
+    def _on_publish(self, client, userdata, mid):
+        if mid == self._leave_mid:
+            client.disconnect()
+
+    def _rebalance(self):
+        with self._lock:
+            if self.client_id not in self.members:
+                # Our own retained presence has not come back yet; a later message triggers us again
+                return
+            self._apply(self._assign(sorted(self.members)))
+
+    def _assign(self, members):
+        if self.mode == "all":
+            return set(self.topic_machines)
+        if self.mode == "static":
+            return {topic for topic, machine_id in self.topic_machines.items()
+                    if stable_hash(machine_id) % self.shard_count == self.shard_index}
+        return {topic for topic, machine_id in self.topic_machines.items()
+                if rendezvous_owner(machine_id, members) == self.client_id}
+
+    def _apply(self, owned):
+        # Called with _lock held
+        gained = sorted(owned - self.subscribed)
+        lost = sorted(self.subscribed - owned)
+        if lost:
+            self.client.unsubscribe(lost)
+        if gained:
+            self.client.subscribe([(topic, 0) for topic in gained])
+        self.subscribed = owned
+        self.rebalances += 1
+        group = f", {len(self.members)} members" if self.mode == "dynamic" else ""
+        logger.info(f"Shard assignment ({self.mode}{group}): {len(owned)} of {len(self.topic_machines)} "
+                    f"machine topics, +{len(gained)} -{len(lost)}")
@@ -0,0 +1,256 @@
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("mqtt_client.writer")
+
+INSERT_SQL = """
+    INSERT INTO SensorData (MachineID, Timestamp, Temperature, Pressure)
+    VALUES (?, ?, ?, ?)
+"""
+
+# Rollup tables kept up to date with SensorData: (table, bucket width in seconds).
+# Each width must be a multiple of the one before it.
+ROLLUPS = (("SensorRollup1m", 60), ("SensorRollup1h", 3600))
+# Tag name stored in the rollup -> position of its value in a SensorData row
+ROLLUP_TAGS = (("Temperature", 2), ("Pressure", 3))
+ROLLUP_EPOCH = datetime(2000, 1, 1)
+
+# min/max/sum/count merge in any order, so a late sample simply folds into
+# its (possibly old) bucket and the result matches aggregating the raw rows.
+MERGE_ROLLUP_SQL = """
+    MERGE {table} WITH (HOLDLOCK) AS t
+    USING (VALUES (?, ?, ?, ?, ?, ?, ?)) AS s (MachineID, Tag, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+    ON t.BucketStart = s.BucketStart AND t.MachineID = s.MachineID AND t.Tag = s.Tag
+    WHEN MATCHED THEN UPDATE SET
+        MinValue = CASE WHEN s.MinValue < t.MinValue THEN s.MinValue ELSE t.MinValue END,
+        MaxValue = CASE WHEN s.MaxValue > t.MaxValue THEN s.MaxValue ELSE t.MaxValue END,
+        SumValue = t.SumValue + s.SumValue,
+        SampleCount = t.SampleCount + s.SampleCount
+    WHEN NOT MATCHED THEN
+        INSERT (MachineID, Tag, BucketStart, MinValue, MaxValue, SumValue, SampleCount)
+        VALUES (s.MachineID, s.Tag, s.BucketStart, s.MinValue, s.MaxValue, s.SumValue, s.SampleCount);
+"""
+
+# SQLSTATE prefixes worth retrying: connection failures (class 08), timeouts and
+# deadlock victims. Anything else (22xxx data, 23xxx constraint errors) fails
+# the same way every time.
+TRANSIENT_SQLSTATES = ("08", "HYT00", "HYT01", "40001")
+
+def is_transient(error):
+    # pyodbc errors carry the SQLSTATE as their first argument
+    state = error.args[0] if error.args and isinstance(error.args[0], str) else ""
+    return state.startswith(TRANSIENT_SQLSTATES)
+
+def bucket_start(timestamp, width):
+    seconds = int((timestamp - ROLLUP_EPOCH).total_seconds())
+    return ROLLUP_EPOCH + timedelta(seconds=seconds - seconds % width)
+
+def merge_partial(partials, key, low, high, total, count):
+    agg = partials.get(key)
+    if agg is None:
+        partials[key] = [low, high, total, count]
+    else:
+        agg[0] = min(agg[0], low)
+        agg[1] = max(agg[1], high)
+        agg[2] += total
+        agg[3] += count
+
+def rollup_rows(batch):
+    """
+    Pre-aggregate a batch of SensorData rows for every rollup table.
+    Returns [(table, [(MachineID, Tag, BucketStart, min, max, sum, count), ...])],
+    one parameter tuple per bucket touched by the batch, so the database
+    merges a few rows per machine instead of one per sample.
+    """
+    partials = {}
+    width = ROLLUPS[0][1]
+    for row in batch:
+        for tag, column in ROLLUP_TAGS:
+            value = row[column]
+            if value is not None:
+                merge_partial(partials, (row[0], tag, bucket_start(row[1], width)), value, value, value, 1)
+
+    result = []
+    for table, rollup_width in ROLLUPS:
+        if rollup_width != width:
+            # Coarser rollups are built from the finer partials, not the rows
+            coarser = {}
+            for (machine_id, tag, start), agg in partials.items():
+                merge_partial(coarser, (machine_id, tag, bucket_start(start, rollup_width)), *agg)
+            partials, width = coarser, rollup_width
+        result.append((table, [(*key, *agg) for key, agg in partials.items()]))
+    return result
+
+
+class BatchWriter:
+    """
+    Write-behind buffer for SensorData rows.
+
+    Rows submitted from the MQTT network thread are accumulated in memory and
+    flushed by a background thread over one long-lived connection, using a
+    single executemany per batch. The rollup tables are merged in the same
+    transaction, so they never disagree with SensorData. A flush fires when `batch_size` rows are
+    pending or when the oldest pending row is `max_latency` seconds old,
+    whichever comes first. `stop()` drains everything that is still pending.
+    With `max_pending` rows waiting, `submit()` either drops the oldest one
+    (overflow="drop-oldest") or blocks until a flush makes room ("block").
+    Connection errors are retried every `retry_delay` seconds; rows the
+    database refuses are set aside (counted in `rows_rejected`).
+    """
+
+    def __init__(self, connect, batch_size=500, max_latency=1.0, max_pending=100000, retry_delay=5,
+                 overflow="drop-oldest"):
+        self._connect = connect
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.overflow = overflow
+
+        self._rows = []
+        self._first_row_at = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._conn = None
+        self._thread = threading.Thread(target=self._run, name="batch-writer", daemon=True)
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+        # Rows set aside because they can never be written
+        self.rows_rejected = 0
+
+    def start(self):
+        self._thread.start()
+
+    @property
+    def pending(self):
+        with self._cond:
+            return len(self._rows)
+
+    def submit(self, row):
+        """Queue one (MachineID, Timestamp, Temperature, Pressure) tuple."""
+        with self._cond:
+            if self.overflow == "block":
+                while len(self._rows) >= self.max_pending and not self._stopping:
+                    self._cond.wait()
+            if len(self._rows) >= self.max_pending:
+                # Bounded memory: the oldest pending sample goes first.
+                self._rows.pop(0)
+                self.rows_dropped += 1
+            if not self._rows:
+                self._first_row_at = time.monotonic()
+            self._rows.append(row)
+            if len(self._rows) >= self.batch_size:
+                # Blocked submitters share the condition, so wake everyone
+                self._cond.notify_all()
+
+    def stop(self, timeout=30):
+        """Flush pending rows and close the connection."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Writer did not drain within {timeout}s, {len(self._rows)} rows lost")
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._stopping:
+                if len(self._rows) >= self.batch_size:
+                    break
+                if self._rows:
+                    remaining = self._first_row_at + self.max_latency - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            batch = self._rows[:self.batch_size]
+            del self._rows[:self.batch_size]
+            if not self._rows:
+                self._first_row_at = None
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._flush(batch)
+                except Exception:
+                    # Losing one batch is better than a dead writer stalling all ingestion
+                    logger.exception(f"Writing a batch of {len(batch)} rows failed, rows lost")
+                    self.rows_rejected += len(batch)
+            elif self._stopping:
+                self._close()
+                return
+
+    def _flush(self, batch):
+        """
+        Write `batch`. A batch the database refuses (a conversion error, a
+        constraint violation) is split in halves until the refused rows are
+        isolated; those are logged and set aside so they cannot hold up the
+        rows behind them.
+        """
+        pending = [batch]
+        while pending:
+            rows = pending.pop()
+            try:
+                self._write(rows)
+            except Exception as e:
+                if len(rows) == 1:
+                    logger.error(f"Setting aside row {rows[0]}: {e}")
+                    self.rows_rejected += 1
+                    continue
+                logger.warning(f"Batch of {len(rows)} rows refused ({e}), splitting it")
+                half = len(rows) // 2
+                # Popped first half first, so rows keep their order
+                pending += [rows[half:], rows[:half]]
+
+    def _write(self, batch):
+        """Insert `batch` and merge its rollups in one transaction. Retries connection errors, raises the rest."""
+        rollups = rollup_rows(batch)
+        while True:
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                cursor = self._conn.cursor()
+                cursor.fast_executemany = True
+                cursor.executemany(INSERT_SQL, batch)
+                for table, params in rollups:
+                    if params:
+                        cursor.executemany(MERGE_ROLLUP_SQL.format(table=table), params)
+                self._conn.commit()
+                cursor.close()
+                self.rows_written += len(batch)
+                logger.info(f"Inserted {len(batch)} rows into database "
+                            f"({', '.join(f'{len(params)} {table}' for table, params in rollups)} rollup rows)")
+                return
+            except Exception as e:
+                if self._conn is not None and not is_transient(e):
+                    self._rollback()
+                    raise
+                logger.error(f"Batch insert of {len(batch)} rows failed: {e}. Retrying in {self.retry_delay} seconds...")
+                self._close()
+                if self._stopping:
+                    # Keep trying on shutdown only as long as stop() is willing to wait.
+                    time.sleep(1)
+                else:
+                    time.sleep(self.retry_delay)
+
+    def _rollback(self):
+        try:
+            self._conn.rollback()
+        except Exception:
+            self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
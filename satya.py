@@ -1,9 +1,12 @@
 from fastapi import FastAPI, HTTPException, Query, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security.api_key import APIKeyHeader
 import pyodbc
-import os
+import json
+import itertools
 from datetime import datetime, timedelta
+from db_pool import create_pool, PoolTimeout
+from archive import archived_days, iter_archive
 
 app = FastAPI(default_response_class=JSONResponse)
 
@@ -26,79 +29,557 @@ def get_api_key(x_api_key: str = Depends(api_key_header), api_key: str = Query(N
     return provided_key
 
 # ---------------------------------------------------------------------------
-# Database Connection Settings
+# Database Connection Pool (settings in db_pool.py, DB_* environment variables)
 # ---------------------------------------------------------------------------
-DB_SERVER = os.getenv("DB_SERVER", "localhost,1533")  # Include port if needed
-DB_DATABASE = os.getenv("DB_DATABASE", "SensorDB")
-DB_USERNAME = os.getenv("DB_USERNAME", "satya")
-DB_PASSWORD = os.getenv("DB_PASSWORD", "Satya@3479")
-DB_DRIVER = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")
-
-def get_db_connection():
-    conn_str = (
-        f"DRIVER={DB_DRIVER};"
-        f"SERVER={DB_SERVER};"
-        f"DATABASE={DB_DATABASE};"
-        f"UID={DB_USERNAME};"
-        f"PWD={DB_PASSWORD};"
-    )
-    return pyodbc.connect(conn_str)
+pool = create_pool()
+
+@app.on_event("startup")
+def open_pool():
+    pool.open()
+
+@app.on_event("shutdown")
+def close_pool():
+    pool.close()
+
+@app.get("/pool", response_class=JSONResponse)
+def pool_stats(key: str = Depends(get_api_key)):
+    """Pool size, utilisation and how long requests waited for a connection."""
+    return {"status": "success", "pool": pool.stats()}
+
+# ---------------------------------------------------------------------------
+# Aggregation and Downsampling
+# ---------------------------------------------------------------------------
+# Supported bucket widths, in seconds
+BUCKETS = {"1m": 60, "5m": 300, "1h": 3600}
+
+# Bucket start = epoch + floor((Timestamp - epoch) / width) * width, computed by
+# SQL Server so only one row per machine per bucket leaves the database.
+BUCKET_QUERY = """
+    SELECT MachineID, Bucket, COUNT(*),
+           AVG(Temperature), MIN(Temperature), MAX(Temperature),
+           AVG(Pressure), MIN(Pressure), MAX(Pressure)
+    FROM (
+        SELECT MachineID, Temperature, Pressure,
+               DATEADD(second, DATEDIFF(second, '2000-01-01', Timestamp) / ? * ?, '2000-01-01') AS Bucket
+        FROM SensorData
+        WHERE Timestamp BETWEEN ? AND ?
+    ) AS b
+    GROUP BY MachineID, Bucket
+    ORDER BY Bucket DESC, MachineID DESC
+"""
+
+# Rollup tables maintained by mqtt-client, coarsest first: (table, bucket width in seconds)
+ROLLUPS = (("SensorRollup1h", 3600), ("SensorRollup1m", 60))
+ROLLUP_EPOCH = datetime(2000, 1, 1)
+
+# Same result columns as BUCKET_QUERY, but the whole rollup buckets inside the
+# window are read from a rollup table. Only the partial rollup buckets at the
+# window edges (before the first boundary, from the last one on) are taken
+# from SensorData, unpivoted to the rollup's (Tag, value) shape.
+# Count is per tag, so it is the larger of the two tag counts.
+ROLLUP_QUERY = """
+    SELECT MachineID, Bucket, MAX(SampleCount),
+           SUM(CASE WHEN Tag = 'Temperature' THEN SumValue END) / SUM(CASE WHEN Tag = 'Temperature' THEN SampleCount END),
+           MIN(CASE WHEN Tag = 'Temperature' THEN MinValue END),
+           MAX(CASE WHEN Tag = 'Temperature' THEN MaxValue END),
+           SUM(CASE WHEN Tag = 'Pressure' THEN SumValue END) / SUM(CASE WHEN Tag = 'Pressure' THEN SampleCount END),
+           MIN(CASE WHEN Tag = 'Pressure' THEN MinValue END),
+           MAX(CASE WHEN Tag = 'Pressure' THEN MaxValue END)
+    FROM (
+        SELECT MachineID, Tag, Bucket,
+               SUM(SampleCount) AS SampleCount, SUM(SumValue) AS SumValue,
+               MIN(MinValue) AS MinValue, MAX(MaxValue) AS MaxValue
+        FROM (
+            SELECT MachineID, Tag, BucketStart, SampleCount, SumValue, MinValue, MaxValue
+            FROM {table}
+            WHERE BucketStart >= ? AND BucketStart < ?
+            UNION ALL
+            SELECT MachineID, v.Tag, Timestamp, 1, v.Value, v.Value, v.Value
+            FROM SensorData
+            CROSS APPLY (VALUES ('Temperature', Temperature), ('Pressure', Pressure)) AS v (Tag, Value)
+            WHERE v.Value IS NOT NULL
+              AND ((Timestamp >= ? AND Timestamp < ?) OR (Timestamp >= ? AND Timestamp <= ?))
+        ) AS p
+        CROSS APPLY (SELECT DATEADD(second, DATEDIFF(second, '2000-01-01', p.BucketStart) / ? * ?, '2000-01-01') AS Bucket) AS k
+        GROUP BY MachineID, Tag, Bucket
+    ) AS b
+    GROUP BY MachineID, Bucket
+    ORDER BY Bucket DESC, MachineID DESC
+"""
+
+RAW_QUERY = """
+    SELECT ID, MachineID, Timestamp, Temperature, Pressure
+    FROM SensorData
+    WHERE Timestamp BETWEEN ? AND ?
+    ORDER BY Timestamp DESC, ID DESC
+"""
+
+PAGE_CLAUSE = " OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+
+# Per machine and tag statistics, so summaries never need the raw rows to
+# leave the database. VARP * COUNT is the sum of squared deviations (m2),
+# which, unlike a standard deviation, merges across tiers and buckets.
+STATS_QUERY = """
+    SELECT MachineID, v.Tag, COUNT(*), AVG(v.Value), VARP(v.Value) * COUNT(*), MIN(v.Value), MAX(v.Value)
+    FROM SensorData
+    CROSS APPLY (VALUES ('Temperature', Temperature), ('Pressure', Pressure)) AS v (Tag, Value)
+    WHERE Timestamp BETWEEN ? AND ? AND v.Value IS NOT NULL
+    GROUP BY MachineID, v.Tag
+"""
+
+PERCENTILE_QUERY = """
+    SELECT DISTINCT MachineID, v.Tag,
+           PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY v.Value) OVER (PARTITION BY MachineID, v.Tag),
+           PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY v.Value) OVER (PARTITION BY MachineID, v.Tag)
+    FROM SensorData
+    CROSS APPLY (VALUES ('Temperature', Temperature), ('Pressure', Pressure)) AS v (Tag, Value)
+    WHERE Timestamp BETWEEN ? AND ? AND v.Value IS NOT NULL
+"""
+
+# The same moments per `width`-second bucket, bucketed like BUCKET_QUERY
+BUCKET_STATS_QUERY = """
+    SELECT MachineID, v.Tag, Bucket, COUNT(*), AVG(v.Value), VARP(v.Value) * COUNT(*), MIN(v.Value), MAX(v.Value)
+    FROM (
+        SELECT MachineID, Temperature, Pressure,
+               DATEADD(second, DATEDIFF(second, '2000-01-01', Timestamp) / ? * ?, '2000-01-01') AS Bucket
+        FROM SensorData
+        WHERE Timestamp BETWEEN ? AND ?
+    ) AS b
+    CROSS APPLY (VALUES ('Temperature', Temperature), ('Pressure', Pressure)) AS v (Tag, Value)
+    WHERE v.Value IS NOT NULL
+    GROUP BY MachineID, v.Tag, Bucket
+"""
+
+# Newest row when the statistics were taken; live consumers resume after it
+LAST_ID_QUERY = "SELECT MAX(ID) FROM SensorData"
+
+# Rows pulled from the cursor per round trip when streaming
+STREAM_CHUNK = 5000
+
+# Numeric fields that downsampling tries to preserve the shape of
+SERIES_FIELDS = ("Temperature", "Pressure")
+
+def bucket_query(width, start_dt, end_dt, cutoff=None):
+    """
+    Query and parameters for `width`-second buckets over [start_dt, end_dt].
+    Uses the coarsest rollup whose buckets tile `width` and that has at least
+    one whole bucket inside the window; falls back to aggregating SensorData.
+    Returns (query, params, source table, ranges of raw rows), the last as
+    (start, end, end inclusive) tuples; SensorData is only read for their
+    parts from `cutoff` on (see archive_cutoff).
+    """
+    hot_start = max(start_dt, cutoff) if cutoff else start_dt
+    for table, size in ROLLUPS:
+        if width % size:
+            continue
+        # Whole rollup buckets covered by the window: [first, last)
+        offset = int((start_dt - ROLLUP_EPOCH).total_seconds()) % size
+        first = start_dt + timedelta(seconds=(size - offset) % size)
+        last = end_dt - timedelta(seconds=int((end_dt - ROLLUP_EPOCH).total_seconds()) % size)
+        if first < last:
+            first_str, last_str = first.strftime("%Y-%m-%d %H:%M:%S"), last.strftime("%Y-%m-%d %H:%M:%S")
+            params = [first_str, last_str,
+                      hot_start.strftime("%Y-%m-%d %H:%M:%S"), first_str,
+                      max(last, hot_start).strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S"),
+                      width, width]
+            raw_ranges = [(start_dt, first, False), (last, end_dt, True)]
+            return ROLLUP_QUERY.format(table=table), params, table, raw_ranges
+    params = [width, width, hot_start.strftime("%Y-%m-%d %H:%M:%S"), end_dt.strftime("%Y-%m-%d %H:%M:%S")]
+    return BUCKET_QUERY, params, "SensorData", [(start_dt, end_dt, True)]
+
+def archive_cutoff(archived):
+    """
+    Start of the day after the newest of the window's archived days, or None.
+    Rows before it are read from the archive only and rows from it on from
+    SensorData only, so no row is read from both tiers or from neither. A day
+    the archiver marks during the request is still in SensorData: archive.py
+    deletes it ARCHIVE_GRACE seconds later.
+    """
+    if not archived:
+        return None
+    return datetime.combine(archived[-1] + timedelta(days=1), datetime.min.time())
+
+def cold_ranges(ranges, cutoff):
+    """The non-empty parts of (start, end, end inclusive) ranges that lie before the cutoff."""
+    if cutoff is None:
+        return []
+    parts = [(start, min(end, cutoff), inclusive and end < cutoff) for start, end, inclusive in ranges if start < cutoff]
+    return [(start, end, inclusive) for start, end, inclusive in parts if start < end or inclusive]
+
+def iter_archive_ranges(ranges):
+    for start, end, inclusive in ranges:
+        yield from iter_archive(start, end, include_end=inclusive)
+
+def bucket_floor(timestamp, width):
+    # Same bucket boundaries as the DATEADD/DATEDIFF expression in the queries
+    seconds = int((timestamp - ROLLUP_EPOCH).total_seconds())
+    return ROLLUP_EPOCH + timedelta(seconds=seconds - seconds % width)
+
+def merge_archived_buckets(rows, archived, width):
+    """
+    Fold archived raw rows into bucket rows (MachineID, Bucket, Count,
+    Temperature avg/min/max, Pressure avg/min/max); newest bucket first.
+    Averages are combined weighted by Count.
+    """
+    buckets = {(row[0], row[1]): list(row) for row in rows}
+    for _, machine_id, timestamp, temperature, pressure in archived:
+        key = (machine_id, bucket_floor(timestamp, width))
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [machine_id, key[1], 1, temperature, temperature, temperature, pressure, pressure, pressure]
+            continue
+        count = bucket[2]
+        bucket[2] = count + 1
+        for i, value in ((3, temperature), (6, pressure)):
+            if value is None:
+                continue
+            if bucket[i] is None:
+                bucket[i:i + 3] = [value, value, value]
+            else:
+                bucket[i] = (bucket[i] * count + value) / (count + 1)
+                bucket[i + 1] = min(bucket[i + 1], value)
+                bucket[i + 2] = max(bucket[i + 2], value)
+    return sorted(buckets.values(), key=lambda bucket: (bucket[1], bucket[0]), reverse=True)
+
+def merge_archive(rows, bucket, ranges):
+    """Combine hot SensorData results with the archived rows of `ranges`."""
+    archived = list(iter_archive_ranges(ranges))
+    if bucket:
+        return merge_archived_buckets(rows, archived, BUCKETS[bucket])
+    return sorted(itertools.chain(rows, archived), key=lambda row: (row[2], row[0]), reverse=True)
+
+def merge_moments(acc, count, mean, m2, low, high):
+    """Fold (count, mean, m2, min, max) into `acc` in place (Chan et al.'s pairwise update)."""
+    total = acc[0] + count
+    delta = mean - acc[1]
+    acc[2] += m2 + delta * delta * acc[0] * count / total
+    acc[1] += delta * count / total
+    acc[3] = low if acc[0] == 0 else min(acc[3], low)
+    acc[4] = high if acc[0] == 0 else max(acc[4], high)
+    acc[0] = total
+
+def merge_archived_moments(archived, moments, buckets=None, width=None):
+    """
+    Fold archived raw rows into {(MachineID, Tag): [count, mean, m2, min, max]}
+    and, if given, the `width`-second {(MachineID, Tag, Bucket): ...} as well.
+    """
+    for _, machine_id, timestamp, *values in archived:
+        for field, value in zip(SERIES_FIELDS, values):
+            if value is None:
+                continue
+            merge_moments(moments.setdefault((machine_id, field), [0, 0.0, 0.0, None, None]), 1, value, 0.0, value, value)
+            if buckets is not None:
+                key = (machine_id, field, bucket_floor(timestamp, width))
+                merge_moments(buckets.setdefault(key, [0, 0.0, 0.0, None, None]), 1, value, 0.0, value, value)
+
+def moments_record(acc, percentiles=None):
+    count, mean, m2, low, high = acc
+    p50, p95 = percentiles or (None, None)
+    return {"count": count, "avg": mean, "min": low, "max": high, "std": (m2 / count) ** 0.5, "p50": p50, "p95": p95}
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets: pick `threshold` of the (x, y) points that
+    best preserve the visual shape of the series. Returns the kept indices,
+    always including the first and last point.
+    """
+    n = len(points)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(points[j][0] for j in range(avg_start, avg_end)) / (avg_end - avg_start)
+        avg_y = sum(points[j][1] for j in range(avg_start, avg_end)) / (avg_end - avg_start)
+
+        ax, ay = points[a]
+        max_area = -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (points[j][1] - ay) - (ax - points[j][0]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                a = j
+        kept.append(a)
+    kept.append(n - 1)
+    return kept
+
+def downsample(rows, max_points):
+    """
+    Reduce each machine's series to at most `max_points` rows with LTTB.
+    The budget is split between the numeric fields and the union of the
+    rows picked for each field is kept, so spikes in either survive. When
+    the union still exceeds `max_points` (each field takes at least 3), it
+    is thinned evenly, keeping its first and last row.
+    Rows must carry a datetime "Timestamp"; order is preserved.
+    """
+    by_machine = {}
+    for idx, row in enumerate(rows):
+        by_machine.setdefault(row["MachineID"], []).append(idx)
+
+    per_field = max(max_points // len(SERIES_FIELDS), 3)
+    keep = set()
+    for indices in by_machine.values():
+        if len(indices) <= max_points:
+            keep.update(indices)
+            continue
+        # LTTB walks the series in time order
+        ordered = sorted(indices, key=lambda i: rows[i]["Timestamp"])
+        picked = set()
+        for field in SERIES_FIELDS:
+            series = [i for i in ordered if rows[i][field] is not None]
+            points = [(rows[i]["Timestamp"].timestamp(), rows[i][field]) for i in series]
+            picked.update(series[k] for k in lttb(points, per_field))
+        picked = [i for i in ordered if i in picked]
+        if len(picked) > max_points:
+            picked = [picked[round(k * (len(picked) - 1) / (max_points - 1))] for k in range(max_points)]
+        keep.update(picked)
+    return [row for idx, row in enumerate(rows) if idx in keep]
+
+def row_to_record(row, bucket):
+    if bucket:
+        # Temperature/Pressure hold the bucket average so raw consumers keep working
+        return {
+            "MachineID": row[0],
+            "Timestamp": row[1],
+            "Count": row[2],
+            "Temperature": row[3],
+            "TemperatureMin": row[4],
+            "TemperatureMax": row[5],
+            "Pressure": row[6],
+            "PressureMin": row[7],
+            "PressureMax": row[8]
+        }
+    return {
+        "ID": row[0],
+        "MachineID": row[1],
+        "Timestamp": row[2],
+        "Temperature": row[3],
+        "Pressure": row[4]
+    }
+
+# ---------------------------------------------------------------------------
+# Streaming Responses
+# ---------------------------------------------------------------------------
+def iter_records(conn, cursor, bucket):
+    """Yield JSON-encoded records straight off the cursor, STREAM_CHUNK rows at a time."""
+    discard = False
+    try:
+        while True:
+            rows = cursor.fetchmany(STREAM_CHUNK)
+            if not rows:
+                break
+            for row in rows:
+                record = row_to_record(row, bucket)
+                record["Timestamp"] = str(record["Timestamp"])
+                yield json.dumps(record)
+    except pyodbc.Error:
+        discard = True
+        raise
+    finally:
+        cursor.close()
+        pool.release(conn, discard=discard)
+
+def iter_archive_records(ranges):
+    for row in iter_archive_ranges(ranges):
+        record = row_to_record(row, None)
+        record["Timestamp"] = str(record["Timestamp"])
+        yield json.dumps(record)
+
+def stream_response(records, stream, header):
+    if stream == "ndjson":
+        return StreamingResponse(stream_ndjson(records), media_type="application/x-ndjson")
+    return StreamingResponse(stream_json(records, header), media_type="application/json")
+
+def stream_ndjson(records):
+    for record in records:
+        yield record + "\n"
+
+def stream_json(records, header):
+    # Same document shape as the buffered response, written out incrementally
+    yield json.dumps(header)[:-1] + ', "data": ['
+    separator = ""
+    for record in records:
+        yield separator + record
+        separator = ","
+    yield "]}"
 
 # ---------------------------------------------------------------------------
 # API Endpoint: Get Sensor Data (Default 24 Hours or Custom Range)
 # ---------------------------------------------------------------------------
+def parse_range(start, end):
+    """The requested window as naive UTC datetimes; the last 24 hours unless both ends are given."""
+    if not start or not end:
+        # Timestamps are stored as naive UTC
+        end_dt = datetime.utcnow()
+        return end_dt - timedelta(hours=24), end_dt
+    try:
+        return datetime.strptime(start, "%Y-%m-%d %H:%M:%S"), datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD HH:MM:SS")
+
 @app.get("/sensors", response_class=JSONResponse)
 def fetch_sensors(
     start: str = Query(None, description="Start datetime in format YYYY-MM-DD HH:MM:SS"),
     end: str = Query(None, description="End datetime in format YYYY-MM-DD HH:MM:SS"),
+    bucket: str = Query(None, description="Aggregate per machine into 1m, 5m or 1h buckets"),
+    max_points: int = Query(None, ge=3, description="Downsample each machine's series to at most this many points"),
+    stream: str = Query(None, description="Stream rows as they are read: ndjson or json"),
+    limit: int = Query(None, ge=1, le=100000, description="Return at most this many rows (newest first)"),
+    offset: int = Query(0, ge=0, description="Skip this many rows before applying limit"),
     key: str = Depends(get_api_key)  # API key can come from header or query parameter
 ):
-    # Determine the time range
-    if not start or not end:
-        end_dt = datetime.now()
-        start_dt = end_dt - timedelta(hours=24)
-    else:
-        try:
-            start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M:%S")
-            end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD HH:MM:SS")
+    start_dt, end_dt = parse_range(start, end)
+    if bucket is not None and bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Invalid bucket. Use one of: {', '.join(BUCKETS)}")
+    if stream is not None and stream not in ("ndjson", "json"):
+        raise HTTPException(status_code=400, detail="Invalid stream format. Use ndjson or json")
+    if stream and max_points:
+        raise HTTPException(status_code=400, detail="max_points needs the full series and cannot be streamed")
 
     start_str = start_dt.strftime("%Y-%m-%d %H:%M:%S")
     end_str = end_dt.strftime("%Y-%m-%d %H:%M:%S")
 
-    # Build the SQL query
-    query = f"""
-        SELECT ID, MachineID, Timestamp, Temperature, Pressure
-        FROM SensorData
-        WHERE Timestamp BETWEEN '{start_str}' AND '{end_str}'
-        ORDER BY Timestamp DESC
-    """
+    # Days already moved to the Parquet archive are merged in below; listed
+    # before a connection is taken so a failure here cannot leak one
+    archived = archived_days(start_dt, end_dt)
+    cutoff = archive_cutoff(archived)
+    hot_str = max(start_dt, cutoff).strftime("%Y-%m-%d %H:%M:%S") if cutoff else start_str
+
+    try:
+        conn = pool.acquire()
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except pyodbc.Error as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute(query)
+        if bucket:
+            query, params, source, raw_ranges = bucket_query(BUCKETS[bucket], start_dt, end_dt, cutoff)
+        else:
+            query, params, source, raw_ranges = RAW_QUERY, [hot_str, end_str], "SensorData", [(start_dt, end_dt, True)]
+        archive_ranges = cold_ranges(raw_ranges, cutoff)
+        if archived:
+            source += "+archive"
+        if limit:
+            # Both queries end in an ORDER BY on a unique key (ties broken by
+            # ID or MachineID), so paging is a plain OFFSET/FETCH; with
+            # archived rows in the window it is applied after merging
+            query += PAGE_CLAUSE
+            params += [0, offset + limit] if archived else [offset, limit]
+        cursor.execute(query, *params)
+
+        header = {"status": "success", "start_time": start_str, "end_time": end_str, "bucket": bucket, "source": source}
+        if stream and not (archived and (bucket or limit)):
+            # The generator owns the connection from here and releases it when done
+            records = iter_records(conn, cursor, bucket)
+            conn = None
+            if archived:
+                # Hot rows first, then the archive; each tier is newest first
+                records = itertools.chain(records, iter_archive_records(archive_ranges))
+            return stream_response(records, stream, header)
+
         rows = cursor.fetchall()
         cursor.close()
-        conn.close()
-
-        data = [
-            {
-                "ID": row[0],
-                "MachineID": row[1],
-                "Timestamp": str(row[2]),
-                "Temperature": row[3],
-                "Pressure": row[4]
-            }
-            for row in rows
-        ]
+        pool.release(conn)
+        conn = None
 
-        return {
-            "status": "success",
-            "start_time": start_str,
-            "end_time": end_str,
-            "data": data
-        }
+        if archived:
+            rows = merge_archive(rows, bucket, archive_ranges)
+            if limit:
+                rows = rows[offset:offset + limit]
+        data = [row_to_record(row, bucket) for row in rows]
+
+        if stream:
+            # Buckets and pages that span the archive are merged in memory first
+            return stream_response((json.dumps({**r, "Timestamp": str(r["Timestamp"])}) for r in data), stream, header)
+
+        if max_points:
+            data = downsample(data, max_points)
+        for record in data:
+            record["Timestamp"] = str(record["Timestamp"])
+
+        return {**header, "data": data}
     except Exception as e:
+        if conn is not None:
+            pool.release(conn, discard=isinstance(e, pyodbc.Error))
         raise HTTPException(status_code=500, detail=str(e))
+
+# ---------------------------------------------------------------------------
+# API Endpoint: Per-Machine Statistics for a Window
+# ---------------------------------------------------------------------------
+@app.get("/sensors/stats", response_class=JSONResponse)
+def fetch_sensor_stats(
+    start: str = Query(None, description="Start datetime in format YYYY-MM-DD HH:MM:SS"),
+    end: str = Query(None, description="End datetime in format YYYY-MM-DD HH:MM:SS"),
+    bucket: str = Query(None, description="Also return count/mean/m2/min/max per 1m, 5m or 1h bucket"),
+    key: str = Depends(get_api_key)
+):
+    """
+    count/avg/min/max/std/p50/p95 per machine and field over a window,
+    computed in SQL so no raw row leaves the database. With `bucket`, the
+    mergeable moments per bucket as well ([start, count, mean, m2, min, max],
+    m2 being the sum of squared deviations), for consumers that roll the
+    window forward. Archived days are folded in; their rows count towards
+    every statistic except the percentiles, which cover the hot table only.
+    """
+    start_dt, end_dt = parse_range(start, end)
+    if bucket is not None and bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Invalid bucket. Use one of: {', '.join(BUCKETS)}")
+    start_str = start_dt.strftime("%Y-%m-%d %H:%M:%S")
+    end_str = end_dt.strftime("%Y-%m-%d %H:%M:%S")
+    archived = archived_days(start_dt, end_dt)
+    # SensorData is only read from the cutoff on, the archive before it
+    cutoff = archive_cutoff(archived)
+    hot_str = max(start_dt, cutoff).strftime("%Y-%m-%d %H:%M:%S") if cutoff else start_str
+
+    try:
+        conn = pool.acquire()
+    except PoolTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except pyodbc.Error as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    try:
+        cursor = conn.cursor()
+        last_id = cursor.execute(LAST_ID_QUERY).fetchone()[0] or 0
+        moments = {(m, tag): [count, mean, m2, low, high]
+                   for m, tag, count, mean, m2, low, high in cursor.execute(STATS_QUERY, hot_str, end_str).fetchall()}
+        percentiles = {(m, tag): (p50, p95)
+                       for m, tag, p50, p95 in cursor.execute(PERCENTILE_QUERY, hot_str, end_str).fetchall()}
+        buckets = None
+        if bucket:
+            width = BUCKETS[bucket]
+            buckets = {(m, tag, start_at): [count, mean, m2, low, high]
+                       for m, tag, start_at, count, mean, m2, low, high
+                       in cursor.execute(BUCKET_STATS_QUERY, width, width, hot_str, end_str).fetchall()}
+        cursor.close()
+        pool.release(conn)
+        conn = None
+    except Exception as e:
+        if conn is not None:
+            pool.release(conn, discard=isinstance(e, pyodbc.Error))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if archived:
+        # Streamed a day at a time; archived rows never leave this process
+        merge_archived_moments(iter_archive_ranges(cold_ranges([(start_dt, end_dt, True)], cutoff)),
+                               moments, buckets, BUCKETS.get(bucket))
+
+    stats = {}
+    for (machine_id, field), acc in sorted(moments.items()):
+        stats.setdefault(machine_id, {})[field] = moments_record(acc, percentiles.get((machine_id, field)))
+    result = {
+        "status": "success", "start_time": start_str, "end_time": end_str, "bucket": bucket,
+        "source": "SensorData+archive" if archived else "SensorData", "last_id": last_id, "stats": stats,
+    }
+    if bucket:
+        result["buckets"] = {}
+        for (machine_id, field, start_at), acc in sorted(buckets.items()):
+            result["buckets"].setdefault(machine_id, {}).setdefault(field, []).append(
+                [start_at.strftime("%Y-%m-%d %H:%M:%S"), *acc])
+    return result
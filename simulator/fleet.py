@@ -0,0 +1,155 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import datetime
+from asyncua import Client
+from asyncua import ua
+from registry import load_registry
+
+# Setup logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("fleet")
+logging.getLogger("asyncua").setLevel(logging.CRITICAL)
+
+# Read configuration from environment variables
+OPCUA_SERVER_URL = os.getenv("OPCUA_SERVER_URL", "opc.tcp://gateway:4840")
+# Number of virtual machines, taken from the front of the registry (0 = all registered machines)
+FLEET_SIZE = int(os.getenv("FLEET_SIZE", "0"))
+# Each machine gets a fixed interval drawn from [SAMPLE_INTERVAL, SAMPLE_INTERVAL_MAX]
+SAMPLE_INTERVAL = float(os.getenv("SAMPLE_INTERVAL", "1.0"))
+SAMPLE_INTERVAL_MAX = float(os.getenv("SAMPLE_INTERVAL_MAX", os.getenv("SAMPLE_INTERVAL", "1.0")))
+# Random offset in seconds applied to every tick, so machines do not write in lockstep
+JITTER = float(os.getenv("JITTER", "0.1"))
+# Machines are spread round-robin over this many OPC UA sessions
+SESSIONS = int(os.getenv("SESSIONS", "8"))
+REPORT_INTERVAL = float(os.getenv("REPORT_INTERVAL", "10"))
+# Stop after this many seconds and print a summary (0 = run until interrupted)
+DURATION = float(os.getenv("DURATION", "0"))
+
+
+class FleetStats:
+    """Counters shared by every machine coroutine; only touched from the event loop thread."""
+
+    def __init__(self, target_rate):
+        self.target_rate = target_rate
+        self.samples = 0
+        self.writes = 0
+        self.errors = 0
+        self.late_ticks = 0
+        self.max_lag = 0.0
+        self.started = time.monotonic()
+
+    def snapshot(self):
+        return self.samples, self.writes, time.monotonic()
+
+    def report(self, since=None):
+        samples, writes, now = self.snapshot()
+        if since is None:
+            since = (0, 0, self.started)
+        elapsed = max(now - since[2], 1e-9)
+        rate = (samples - since[0]) / elapsed
+        logger.info(
+            f"Samples: {rate:.1f}/s of {self.target_rate:.1f}/s target ({100 * rate / self.target_rate:.1f}%), "
+            f"write requests: {(writes - since[1]) / elapsed:.1f}/s, errors: {self.errors}, "
+            f"late ticks: {self.late_ticks}, max lag: {self.max_lag * 1000:.0f} ms"
+        )
+        self.max_lag = 0.0
+        return samples, writes, now
+
+
+async def run_machine(client, nsidx, machine, interval, stats):
+    machine_id = machine["id"]
+    nodes = [client.get_node(f"ns={nsidx};s={machine_id}_{tag['node']}") for tag in machine["tags"]]
+    variant_types = [getattr(ua.VariantType, tag.get("type", "Double")) for tag in machine["tags"]]
+
+    loop = asyncio.get_running_loop()
+    # Stagger start-up across one interval so the fleet does not fire at once
+    next_tick = loop.time() + random.uniform(0, interval)
+    while True:
+        scheduled = next_tick + random.uniform(-JITTER, JITTER)
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            stats.late_ticks += 1
+            stats.max_lag = max(stats.max_lag, -delay)
+        next_tick += interval
+
+        # One WriteRequest per sample, every tag stamped with the same SourceTimestamp
+        current_time = datetime.datetime.utcnow()
+        values = [
+            ua.DataValue(
+                Value=ua.Variant(round(random.uniform(tag["min"], tag["max"]), 2), variant_type),
+                SourceTimestamp=current_time,
+            )
+            for tag, variant_type in zip(machine["tags"], variant_types)
+        ]
+        try:
+            await client.write_values(nodes, values)
+            stats.samples += 1
+            stats.writes += 1
+        except Exception as e:
+            stats.errors += 1
+            logger.debug(f"{machine_id} write failed: {e}")
+
+
+async def connect(url):
+    client = Client(url)
+    while True:
+        try:
+            await client.connect()
+            return client
+        except Exception as e:
+            logger.error(f"Connection to {url} failed: {e}")
+            await asyncio.sleep(10)
+
+
+async def report_loop(stats):
+    since = stats.snapshot()
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        since = stats.report(since)
+
+
+async def main():
+    namespace, machines = load_registry()
+    if FLEET_SIZE:
+        if FLEET_SIZE > len(machines):
+            raise SystemExit(f"FLEET_SIZE={FLEET_SIZE} but the registry only defines {len(machines)} machines")
+        machines = machines[:FLEET_SIZE]
+
+    intervals = [random.uniform(SAMPLE_INTERVAL, SAMPLE_INTERVAL_MAX) for _ in machines]
+    stats = FleetStats(target_rate=sum(1 / interval for interval in intervals))
+
+    logger.info(f"Connecting {SESSIONS} sessions to {OPCUA_SERVER_URL}")
+    clients = await asyncio.gather(*(connect(OPCUA_SERVER_URL) for _ in range(SESSIONS)))
+    nsidx = await clients[0].get_namespace_index(namespace)
+    logger.info(f"Simulating {len(machines)} machines, target {stats.target_rate:.1f} samples/s")
+
+    tasks = [
+        asyncio.create_task(run_machine(clients[i % SESSIONS], nsidx, machine, interval, stats))
+        for i, (machine, interval) in enumerate(zip(machines, intervals))
+    ]
+    tasks.append(asyncio.create_task(report_loop(stats)))
+    try:
+        if DURATION:
+            await asyncio.sleep(DURATION)
+        else:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info("Run summary:")
+        stats.report()
+        await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+        logger.info("Disconnected from OPC UA server")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -1,21 +1,86 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from starlette.websockets import WebSocketState
-import aioodbc
 import asyncio
+from collections import deque
 from datetime import datetime
+from db_pool import create_pool
 
 app = FastAPI()
 
-# MSSQL Database Configuration
-DB_CONFIG = {
-    "dsn": "DRIVER={ODBC Driver 17 for SQL Server};SERVER=localhost,1533;DATABASE=SensorDB;UID=satya;PWD=Satya@3479"
-}
-
-# Query to fetch the most recent 10 records
-QUERY = "SELECT TOP 10 * FROM SensorData ORDER BY Timestamp DESC"
-
-# Track the last known state of data
-last_snapshot = []
+# MSSQL connections come from the pool shared with the sensors API (see db_pool.py).
+# pyodbc calls run in a worker thread so the event loop never blocks on the database.
+pool = create_pool()
+
+# Change feed queries, keyed on the identity column as a monotonic watermark.
+# Rows are only ever appended by mqtt-client, so "ID > watermark" is exactly the new rows.
+COLUMNS = "ID, MachineID, Timestamp, Temperature, Pressure"
+LATEST_QUERY = f"SELECT TOP (?) {COLUMNS} FROM SensorData ORDER BY ID DESC"
+CHANGES_QUERY = f"SELECT TOP (?) {COLUMNS} FROM SensorData WHERE ID > ? AND ID <= ? ORDER BY ID"
+
+# One poller serves every client, so DB load does not grow with connections
+POLL_INTERVAL = 0.1
+# Rows read per change-feed query; a burst larger than this is read in several chunks
+POLL_BATCH = 1000
+# Recent rows kept in memory so reconnecting or lagging clients resume without a query
+REPLAY_BUFFER = 10000
+# Rows sent to a client that connects without a resume position
+INITIAL_ROWS = 10
+# Furthest (in IDs) a client is caught up row by row; one further behind is
+# told to reload instead ({"resync": true, "last_id": ...}) and resumes from there
+MAX_CATCHUP = 50000
+# Messages buffered per client; a client that falls further behind is resynced from its position
+CLIENT_QUEUE_SIZE = 100
+
+# SensorData.ID is an INT identity
+MAX_ID = 2 ** 31 - 1
+
+# Highest ID read by the poller, and the rows leading up to it
+watermark = 0
+recent_rows = deque(maxlen=REPLAY_BUFFER)
+
+poller_task = None
+# Created on the server's event loop at startup: the fan-out to clients, and an
+# event set while the watermark and replay buffer are current
+broadcaster = None
+in_sync = None
+
+
+class Subscriber:
+    """One websocket's queue plus its resume position (the last ID it was sent)."""
+
+    def __init__(self, last_id, maxsize):
+        self.last_id = last_id
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+
+
+class Broadcaster:
+    """Fans each batch of new rows out to every subscribed websocket through its own bounded queue."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.subscribers = set()
+        # Set while anyone is subscribed; the poller waits on it when nobody is
+        self.active = asyncio.Event()
+
+    def subscribe(self, last_id):
+        subscriber = Subscriber(last_id, self.maxsize)
+        self.subscribers.add(subscriber)
+        self.active.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+        if not self.subscribers:
+            self.active.clear()
+
+    def publish(self, rows):
+        for subscriber in self.subscribers:
+            if subscriber.queue.full():
+                # Never block the poller on a slow client; it catches up from its own position
+                subscriber.lagged = True
+            else:
+                subscriber.queue.put_nowait(rows)
 
 
 # Convert datetime to string for JSON serialization
@@ -29,46 +94,131 @@ def serialize_row(row, description):
 
 
 # Fetch data from database
-async def fetch_data():
-    async with aioodbc.create_pool(dsn=DB_CONFIG["dsn"], minsize=1, maxsize=5) as pool:
-        async with pool.acquire() as conn:
-            async with conn.cursor() as cur:
-                await cur.execute(QUERY)
-                rows = await cur.fetchall()
-                if not rows:
-                    return []
-                return [serialize_row(row, cur.description) for row in rows]
-
-
-# Get only new/updated records
-def get_updates(new_data, last_data):
-    if not last_data:
-        return new_data  # Send all data if it's the first fetch
-
-    # Send only the new/updated records by comparing last snapshot
-    new_set = {tuple(d.items()) for d in new_data}
-    last_set = {tuple(d.items()) for d in last_data}
-
-    updates = [dict(record) for record in (new_set - last_set)]
-    return updates
+def query_rows(query, params):
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, *params)
+        rows = cursor.fetchall()
+        description = cursor.description
+        cursor.close()
+    return [serialize_row(row, description) for row in rows]
+
+
+async def fetch_data(query, *params):
+    return await asyncio.to_thread(query_rows, query, params)
+
+
+async def fetch_changes(after_id, up_to_id):
+    """Yield every row with after_id < ID <= up_to_id in ID order, POLL_BATCH rows at a time."""
+    while after_id < up_to_id:
+        rows = await fetch_data(CHANGES_QUERY, POLL_BATCH, after_id, up_to_id)
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]["ID"]
+
+
+async def poll_database():
+    global watermark
+    while True:
+        try:
+            if not broadcaster.subscribers:
+                # Nobody is listening: stop querying until a client subscribes
+                in_sync.clear()
+                await broadcaster.active.wait()
+            if not in_sync.is_set():
+                # (Re)seed the replay buffer and watermark with the newest rows
+                # rather than reading through everything written while idle
+                latest = await fetch_data(LATEST_QUERY, REPLAY_BUFFER)
+                recent_rows.clear()
+                recent_rows.extend(reversed(latest))
+                watermark = latest[0]["ID"] if latest else 0
+                in_sync.set()
+            # Read everything past the watermark, so a burst is delivered in full
+            async for rows in fetch_changes(watermark, MAX_ID):
+                recent_rows.extend(rows)
+                watermark = rows[-1]["ID"]
+                broadcaster.publish(rows)
+        except Exception as e:
+            print(f"Poller error: {e}")
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+@app.on_event("startup")
+async def start_poller():
+    global poller_task, broadcaster, in_sync
+    broadcaster = Broadcaster(CLIENT_QUEUE_SIZE)
+    in_sync = asyncio.Event()
+    await asyncio.to_thread(pool.open)
+    poller_task = asyncio.create_task(poll_database())
+
+
+@app.on_event("shutdown")
+async def stop_poller():
+    poller_task.cancel()
+    try:
+        await poller_task
+    except asyncio.CancelledError:
+        pass
+    pool.close()
+
+
+async def send_rows(websocket, subscriber, rows):
+    # Anything at or below the resume position was already delivered
+    rows = [row for row in rows if row["ID"] > subscriber.last_id]
+    if rows:
+        await websocket.send_json(rows)
+        subscriber.last_id = rows[-1]["ID"]
+
+
+async def catch_up(websocket, subscriber):
+    """
+    Send the rows after a client's resume position, POLL_BATCH rows per
+    message: from the replay buffer when it reaches back far enough, otherwise
+    read page by page. A client more than MAX_CATCHUP IDs behind gets a
+    resync message and continues from the watermark.
+    """
+    if watermark - subscriber.last_id > MAX_CATCHUP:
+        subscriber.last_id = watermark
+        await websocket.send_json({"resync": True, "last_id": watermark})
+        return
+    if recent_rows and recent_rows[0]["ID"] <= subscriber.last_id + 1:
+        rows = [row for row in recent_rows if row["ID"] > subscriber.last_id]
+        for i in range(0, len(rows), POLL_BATCH):
+            await send_rows(websocket, subscriber, rows[i:i + POLL_BATCH])
+        return
+    async for rows in fetch_changes(subscriber.last_id, watermark):
+        await send_rows(websocket, subscriber, rows)
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    global last_snapshot
+async def websocket_endpoint(websocket: WebSocket, since: int = None):
+    """
+    Streams new SensorData rows in ID order, as JSON lists of at most
+    POLL_BATCH rows. Pass ?since=<last ID received> on reconnect to resume
+    without gaps; without it the newest INITIAL_ROWS rows are sent first. A
+    position more than MAX_CATCHUP IDs back is answered with
+    {"resync": true, "last_id": ...} instead of the rows in between.
+    """
     await websocket.accept()
+    # Subscribing wakes an idle poller; the resume position is only worked out
+    # once it has caught up with the table
+    subscriber = broadcaster.subscribe(since or 0)
     try:
+        await in_sync.wait()
+        if since is None:
+            since = recent_rows[-INITIAL_ROWS - 1]["ID"] if len(recent_rows) > INITIAL_ROWS else 0
+            subscriber.last_id = since
+        await catch_up(websocket, subscriber)
         while True:
-            new_data = await fetch_data()
-            updates = get_updates(new_data, last_snapshot)
-
-            # Send only new or updated records
-            if updates:
-                last_snapshot = new_data
-                await websocket.send_json(updates)
-
-            # Poll every 0.1 second (optimized delay for real-time updates)
-            await asyncio.sleep(0.1)
+            if subscriber.lagged:
+                # Queue overflowed: discard it and resume from the last delivered ID
+                subscriber.lagged = False
+                while not subscriber.queue.empty():
+                    subscriber.queue.get_nowait()
+                await catch_up(websocket, subscriber)
+            rows = await subscriber.queue.get()
+            await send_rows(websocket, subscriber, rows)
 
     except WebSocketDisconnect:
         print("WebSocket disconnected")
@@ -77,6 +227,7 @@ async def websocket_endpoint(websocket: WebSocket):
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.close()
     finally:
+        broadcaster.unsubscribe(subscriber)
         if websocket.client_state == WebSocketState.CONNECTED:
             try:
                 await websocket.close()
@@ -86,4 +237,4 @@ async def websocket_endpoint(websocket: WebSocket):
 
 @app.get("/")
 async def read_root():
-    return {"message": "WebSocket ready at /ws"}
+    return {"message": "WebSocket ready at /ws", "pool": pool.stats()}